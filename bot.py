@@ -5,9 +5,12 @@ Startup sequence:
 1. Load config (pydantic settings)
 2. Create Bot + Dispatcher
 3. Register all handlers
-4. Configure and start APScheduler
+4. Unless BOT_BACKGROUND_JOBS is off: start the background jobs
+   (services/background.py) — APScheduler and the exact-time reminder
+   engine on the elected leader replica, and the notification outbox
+   workers. worker.py runs the same without polling.
 5. Start polling (blocks until shutdown)
-6. On shutdown: stop scheduler gracefully
+6. On shutdown: stop scheduler and workers gracefully
 """
 from __future__ import annotations
 
@@ -33,8 +36,10 @@ from handlers import (
     reports_router,
     settings_router,
 )
-from middlewares.db_session import DbSessionMiddleware
-from services.scheduler import create_scheduler
+from middlewares.db_session import DbFlagsMiddleware, DbSessionMiddleware
+from middlewares.reachability import ReachabilityMiddleware
+from middlewares.send_budget import InteractiveRepliesMiddleware
+from services.background import Background, create_send_bucket
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Logging
@@ -53,7 +58,13 @@ logger = logging.getLogger(__name__)
 
 async def main() -> None:
     dp = Dispatcher(storage=MemoryStorage())
+    # Ответы на апдейты не тратят общий бюджет отправок (его держат рассылки)
+    dp.update.outer_middleware(InteractiveRepliesMiddleware())
     dp.update.middleware(DbSessionMiddleware())
+    # Any update from a user who blocked the bot earlier turns their notifications back on
+    dp.update.middleware(ReachabilityMiddleware())
+    dp.message.middleware(DbFlagsMiddleware())
+    dp.callback_query.middleware(DbFlagsMiddleware())
     dp.include_router(start_router)
     dp.include_router(subscriptions_router)
     dp.include_router(categories_router)
@@ -65,20 +76,30 @@ async def main() -> None:
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
 
-    # Scheduler for notifications
-    scheduler = create_scheduler(
-        bot=bot,
-        session_factory=db_helper.session_factory,
-    )
-    scheduler.start()
-    logger.info("Scheduler started.")
+    # Every send through this token, here and in other processes, shares one budget
+    send_bucket = create_send_bucket(bot, db_helper.session_factory, config.SEND_BUDGET_STORE, config.TELEGRAM_SEND_RATE)
+
+    # Open a few DB connections up front so the first updates skip the handshake
+    await db_helper.warmup(config.DB_POOL_WARMUP)
+
+    # Scheduler queues notifications, outbox workers deliver them (services/background.py).
+    # With BOT_BACKGROUND_JOBS=false they run in worker.py instead.
+    background = None
+    if config.BOT_BACKGROUND_JOBS:
+        background = Background.from_config(bot, db_helper.shards, send_bucket, config)
+        await background.start()
+    else:
+        logger.info("Background jobs are off here; run worker.py for notifications.")
 
     try:
         logger.info("Starting bot...")
         await dp.start_polling(bot)
     finally:
-        scheduler.shutdown(wait=False)
+        if background is not None:
+            await background.stop()
         await bot.session.close()
+        logger.info("DB pool on shutdown: %s", db_helper.pool_stats())
+        await db_helper.dispose()
         logger.info("Bot shut down cleanly.")
 
 
@@ -6,7 +6,66 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     JWT_SECRET: str = ""  # для API subboy; если пусто — используется BOT_TOKEN
     WEB_ORIGIN: str = "http://localhost:5173"  # откуда разрешён запрос к API (CORS)
+    # Токен для статистики пулов и реплик в /api/health (Authorization: Bearer <токен>);
+    # если пусто — /api/health отдаёт только статус
+    HEALTH_TOKEN: str = ""
+
+    # Пул соединений с PostgreSQL (DB_POOL_SIZE=0 — без пула, новое соединение на каждый запрос)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10  # сколько соединений можно открыть сверх DB_POOL_SIZE при пиках
+    DB_POOL_TIMEOUT: float = 30.0  # сколько секунд ждать свободное соединение
+    DB_POOL_RECYCLE: int = 1800  # пересоздавать соединения старше N секунд
+    DB_POOL_PRE_PING: bool = True  # проверять соединение перед выдачей из пула
+    DB_POOL_WARMUP: int = 2  # сколько соединений открыть заранее при старте
+    # Режим сессий только для чтения: "autocommit" (без BEGIN/ROLLBACK) или "readonly" (READ ONLY DEFERRABLE)
+    DB_READ_MODE: str = "autocommit"
+
+    # Дополнительные шарды (через запятую): DATABASE_URL — шард 0, дальше по порядку.
+    # Пользователь привязан к шарду по своему id, менять порядок нельзя — только дописывать.
+    DATABASE_SHARD_URLS: str = ""
+    # Реплики для чтения: через запятую внутри шарда, группы шардов через ";"
+    # (первая группа — реплики DATABASE_URL); пусто — все запросы идут на primary
+    DATABASE_REPLICA_URLS: str = ""
+    DB_PRIMARY_PIN_SECONDS: float = 10.0  # сколько секунд после записи читать данные пользователя с primary
+
+    # Общий на все процессы бюджет отправок в Telegram (сообщений в секунду на токен бота).
+    # Ниже лимита Telegram (~30/с): остаток — запас под ответы хендлеров, они из бюджета не списываются
+    # SEND_BUDGET_STORE: "postgres" — делить бюджет через таблицу send_budget, "memory" — только внутри процесса
+    TELEGRAM_SEND_RATE: float = 25.0
+    SEND_BUDGET_STORE: str = "postgres"
+
+    # false — бот только отвечает на апдейты, а планировщик и рассылку выполняет отдельный worker.py
+    BOT_BACKGROUND_JOBS: bool = True
+    OUTBOX_WORKERS: int = 1  # сколько воркеров разбирают очередь уведомлений на каждом шарде
+    # Раз в NOTIFY_TICK_MINUTES минут уведомления получают те, у кого наступило их местное время.
+    # Каждый прогон делится на части (по user_id % NOTIFY_JOB_UNITS), их параллельно разбирают воркеры
+    NOTIFY_TICK_MINUTES: int = 15
+    NOTIFY_JOB_UNITS: int = 16
+    NOTIFY_JOB_WORKERS: int = 4
+    # Задачи планировщика выполняет одна реплика бота (лидер по advisory lock в PostgreSQL).
+    # Раз в столько секунд лидер продлевает аренду, остальные пробуют её перехватить
+    LEADER_RENEW_SECONDS: float = 5.0
+    # Задача может стартовать с опозданием до SCHEDULER_MISFIRE_GRACE_SECONDS; несколько пропущенных
+    # запусков подряд сливаются в один (SCHEDULER_COALESCE). Новый лидер догоняет пропущенное при старте
+    SCHEDULER_MISFIRE_GRACE_SECONDS: int = 300
+    SCHEDULER_COALESCE: bool = True
+    # Напоминания «за день» в точное время: лидер держит ближайшие в памяти и узнаёт об изменениях
+    # подписок через LISTEN/NOTIFY; раз в REMINDER_RECONCILE_SECONDS сверяется с БД.
+    # REMINDER_ENGINE=false — только периодическая рассылка раз в NOTIFY_TICK_MINUTES
+    REMINDER_ENGINE: bool = True
+    REMINDER_RECONCILE_SECONDS: float = 600.0
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
+    @property
+    def shard_urls(self) -> list[str]:
+        return [url.strip() for url in self.DATABASE_SHARD_URLS.split(",") if url.strip()]
+
+    @property
+    def replica_urls(self) -> list[list[str]]:
+        return [
+            [url.strip() for url in group.split(",") if url.strip()]
+            for group in self.DATABASE_REPLICA_URLS.split(";")
+        ]
+
 config = Settings()
@@ -6,14 +6,21 @@ CREATE TABLE IF NOT EXISTS users (
     id BIGINT PRIMARY KEY,
     username VARCHAR,
     full_name VARCHAR,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    unreachable_since TIMESTAMP
 );
 
+-- Для существующих баз: отметка о том, что пользователь заблокировал бота
+ALTER TABLE users ADD COLUMN IF NOT EXISTS unreachable_since TIMESTAMP;
+-- Недоступных пользователей мало: рассылки исключают их по этому маленькому индексу
+CREATE INDEX IF NOT EXISTS ix_users_unreachable ON users (id) WHERE unreachable_since IS NOT NULL;
+
 -- Таблица категорий
 CREATE TABLE IF NOT EXISTS categories (
     id SERIAL PRIMARY KEY,
     user_id BIGINT NOT NULL,
     name VARCHAR NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
@@ -26,16 +33,103 @@ CREATE TABLE IF NOT EXISTS subscriptions (
     price NUMERIC(10, 2) NOT NULL,
     period VARCHAR NOT NULL,
     next_payment DATE NOT NULL,
+    anchor_day SMALLINT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    lead_days INTEGER,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL
 );
 
+-- Индекс для выборок по дате списания (напоминания, дайджесты)
+CREATE INDEX IF NOT EXISTS ix_subscriptions_next_payment ON subscriptions (next_payment);
+
 -- Таблица настроек уведомлений
 CREATE TABLE IF NOT EXISTS notification_settings (
     user_id BIGINT PRIMARY KEY,
     day_before BOOLEAN DEFAULT TRUE,
     weekly BOOLEAN DEFAULT TRUE,
     monthly BOOLEAN DEFAULT FALSE,
+    timezone VARCHAR NOT NULL DEFAULT 'Europe/Moscow',
+    notify_hour INTEGER NOT NULL DEFAULT 12,
+    lead_days INTEGER NOT NULL DEFAULT 2,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Часовой пояс и час уведомлений для баз, созданных до их появления
+ALTER TABLE notification_settings ADD COLUMN IF NOT EXISTS timezone VARCHAR NOT NULL DEFAULT 'Europe/Moscow';
+ALTER TABLE notification_settings ADD COLUMN IF NOT EXISTS notify_hour INTEGER NOT NULL DEFAULT 12;
+
+-- Сроки напоминаний (битовая маска: бит N — за N дней до списания; 2 — только за день)
+ALTER TABLE notification_settings ADD COLUMN IF NOT EXISTS lead_days INTEGER NOT NULL DEFAULT 2;
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS lead_days INTEGER;
+
+-- День месяца, в который идут списания: даты считаются от него, а не от прошлой даты,
+-- поэтому 31-е не «съезжает» на 28-е после февраля
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS anchor_day SMALLINT;
+UPDATE subscriptions SET anchor_day = EXTRACT(DAY FROM next_payment) WHERE anchor_day IS NULL;
+
+-- Для существующих баз: время последнего изменения, по нему проверяется свежесть прогноза (/reports/forecast)
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Общий бюджет отправок в Telegram для всех процессов с одним токеном бота
+CREATE TABLE IF NOT EXISTS send_budget (
+    key VARCHAR PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL,
+    paused_until DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+-- Журнал отправленных уведомлений: повторный запуск задачи не дублирует сообщения
+CREATE TABLE IF NOT EXISTS notification_ledger (
+    user_id BIGINT NOT NULL,
+    kind VARCHAR NOT NULL,
+    period_key VARCHAR NOT NULL,
+    subscription_id INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, kind, period_key, subscription_id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Очередь готовых уведомлений (outbox): планировщик пишет, воркеры отправляют
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    kind VARCHAR NOT NULL,
+    body TEXT NOT NULL,
+    status VARCHAR NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    last_error VARCHAR,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
+
+-- Воркеры выбирают только ожидающие сообщения, очистка — только завершённые
+CREATE INDEX IF NOT EXISTS ix_notification_outbox_pending ON notification_outbox (available_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS ix_notification_outbox_finished ON notification_outbox (finished_at) WHERE status <> 'pending';
+
+-- Части ежедневного прогона (бакеты user_id % units), которые воркеры разбирают параллельно
+CREATE TABLE IF NOT EXISTS job_run_units (
+    run_key VARCHAR NOT NULL,
+    unit INTEGER NOT NULL,
+    units INTEGER NOT NULL,
+    status VARCHAR NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    advanced INTEGER NOT NULL DEFAULT 0,
+    queued INTEGER NOT NULL DEFAULT 0,
+    last_error VARCHAR,
+    PRIMARY KEY (run_key, unit)
+);
+
+-- Последний запуск каждой задачи планировщика: по нему после рестарта догоняются пропущенные запуски
+CREATE TABLE IF NOT EXISTS scheduler_job_state (
+    job_id VARCHAR PRIMARY KEY,
+    last_run_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
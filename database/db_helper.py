@@ -1,29 +1,339 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.pool import NullPool
+import asyncio
+import itertools
+import time
+from dataclasses import asdict, dataclass
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 from .models import Base
 from config import config
 
-class DatabaseHelper:
-    def __init__(self, url: str, echo: bool = False):
-        # Используем NullPool для избежания проблем с пулом соединений на Windows
-        # Это создает новое соединение для каждого запроса, но более надежно
-        self.engine = create_async_engine(
-            url=url,
-            echo=echo,
-            poolclass=NullPool,  # Не используем пул - создаем новое соединение каждый раз
-        )
+
+@dataclass(frozen=True)
+class PoolStats:
+    """Снимок состояния пула соединений."""
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    waiting: int
+    connects: int
+    connect_avg_ms: float
+    connect_max_ms: float
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Обычный asyncio-пул SQLAlchemy, который дополнительно считает
+    ожидающих соединение и время установки новых соединений.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.connects = 0
+        self.connect_total = 0.0
+        self.connect_max = 0.0
+
+    def _do_get(self):
+        # Пока корутина ждёт свободное соединение (или открывает новое), она учтена в waiting
+        self.waiting += 1
+        try:
+            return super()._do_get()
+        finally:
+            self.waiting -= 1
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        record = super()._create_connection()
+        elapsed = time.perf_counter() - started
+        self.connects += 1
+        self.connect_total += elapsed
+        self.connect_max = max(self.connect_max, elapsed)
+        return record
+
+
+class TrackedSession(Session):
+    """Сессия, которая помнит, закоммитила ли она изменения (нужно для read-your-writes)."""
+
+
+@event.listens_for(TrackedSession, "after_flush")
+def _mark_flushed(session, flush_context):
+    session.info["flushed"] = True
+
+
+@event.listens_for(TrackedSession, "after_commit")
+def _mark_committed(session):
+    if session.info.pop("flushed", False):
+        session.info["committed_writes"] = True
+
+
+@event.listens_for(TrackedSession, "after_rollback")
+def _forget_flushed(session):
+    session.info.pop("flushed", None)
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach): номер шарда для ключа.
+    При переходе с N на N+1 шардов переезжает только ~1/(N+1) пользователей.
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+class Shard:
+    """Один узел данных: primary, его реплики и фабрики сессий к ним."""
+
+    def __init__(
+        self,
+        index: int,
+        url: str,
+        pool_kwargs: dict,
+        echo: bool = False,
+        read_mode: str = "autocommit",
+        replica_urls: list[str] | None = None,
+        primary_pin_seconds: float = 10.0,
+    ):
+        self.index = index
+        self.engine = create_async_engine(url=url, echo=echo, **pool_kwargs)
         self.session_factory = async_sessionmaker(
             bind=self.engine,
             autoflush=False,
             autocommit=False,
             expire_on_commit=False,
+            sync_session_class=TrackedSession,
+        )
+        # Сессии для хендлеров и маршрутов, которые только читают
+        self.read_session_factory = self._read_factory(self.engine, read_mode)
+
+        # Реплики: читающие сессии уходят на них по кругу
+        self.replica_engines = [
+            create_async_engine(url=replica_url, echo=echo, **pool_kwargs)
+            for replica_url in replica_urls or []
+        ]
+        self._replica_factories = [
+            self._read_factory(replica, read_mode) for replica in self.replica_engines
+        ]
+        self._replica_cycle = itertools.cycle(self._replica_factories)
+
+        # Пользователи, которые недавно что-то записали, читают с primary (read-your-writes)
+        self.primary_pin_seconds = primary_pin_seconds
+        self._pinned_until: dict[int, float] = {}
+
+    @classmethod
+    def _read_factory(cls, engine: AsyncEngine, read_mode: str) -> async_sessionmaker[AsyncSession]:
+        return async_sessionmaker(
+            bind=cls._read_engine(engine, read_mode),
+            autoflush=False,
+            autocommit=False,
+            expire_on_commit=False,
+        )
+
+    @staticmethod
+    def _read_engine(engine: AsyncEngine, read_mode: str) -> AsyncEngine:
+        if read_mode == "autocommit":
+            # Каждый запрос — один round trip, без BEGIN/ROLLBACK вокруг него
+            return engine.execution_options(isolation_level="AUTOCOMMIT")
+        if read_mode == "readonly":
+            # DEFERRABLE действует только на SERIALIZABLE-транзакциях, READ ONLY — всегда
+            return engine.execution_options(postgresql_readonly=True, postgresql_deferrable=True)
+        raise ValueError(f"Unknown DB read mode: {read_mode!r}")
+
+    # ── Маршрутизация чтения ───────────────────────────────────────────────
+
+    def reader(self, user_id: int | None = None) -> async_sessionmaker[AsyncSession]:
+        """
+        Фабрика сессий для чтения: реплика, если они настроены и пользователь
+        не писал в последние primary_pin_seconds, иначе primary.
+        """
+        if not self._replica_factories or (user_id is not None and self.is_pinned(user_id)):
+            return self.read_session_factory
+        return next(self._replica_cycle)
+
+    def pin_primary(self, user_id: int) -> None:
+        """Отправлять чтения пользователя на primary, пока реплики не догонят его запись."""
+        if not self._replica_factories:
+            return
+        now = time.monotonic()
+        if len(self._pinned_until) > 10_000:
+            self._pinned_until = {uid: t for uid, t in self._pinned_until.items() if t > now}
+        self._pinned_until[user_id] = now + self.primary_pin_seconds
+
+    def is_pinned(self, user_id: int) -> bool:
+        until = self._pinned_until.get(user_id)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._pinned_until[user_id]
+            return False
+        return True
+
+    # ── Обслуживание ───────────────────────────────────────────────────────
+
+    @property
+    def engines(self) -> list[AsyncEngine]:
+        return [self.engine, *self.replica_engines]
+
+    def stats(self) -> dict:
+        return {
+            "primary": asdict(_engine_stats(self.engine)),
+            "replicas": [asdict(_engine_stats(engine)) for engine in self.replica_engines],
+        }
+
+    async def dispose(self):
+        for engine in self.engines:
+            await engine.dispose()
+
+
+class DatabaseHelper:
+    """
+    Точка входа в БД. Данные пользователя целиком живут на одном шарде,
+    номер которого определяется по его Telegram id (jump_hash). Без
+    дополнительных шардов всё работает с одним узлом DATABASE_URL.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        echo: bool = False,
+        pool_size: int = 10,
+        max_overflow: int = 10,
+        pool_timeout: float = 30.0,
+        pool_recycle: int = 1800,
+        pool_pre_ping: bool = True,
+        read_mode: str = "autocommit",
+        replica_urls: list[list[str]] | None = None,
+        primary_pin_seconds: float = 10.0,
+        shard_urls: list[str] | None = None,
+    ):
+        if pool_size > 0:
+            pool_kwargs = dict(
+                poolclass=InstrumentedPool,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=pool_timeout,
+                pool_recycle=pool_recycle,
+                pool_pre_ping=pool_pre_ping,
+            )
+        else:
+            # Без пула: новое соединение на каждый запрос (запасной вариант, если пул мешает)
+            pool_kwargs = dict(poolclass=NullPool)
+        urls = [url, *(shard_urls or [])]
+        replica_urls = replica_urls or []
+        self.shards = [
+            Shard(
+                index,
+                shard_url,
+                pool_kwargs,
+                echo=echo,
+                read_mode=read_mode,
+                replica_urls=replica_urls[index] if index < len(replica_urls) else None,
+                primary_pin_seconds=primary_pin_seconds,
+            )
+            for index, shard_url in enumerate(urls)
+        ]
+
+    # Шард 0 (DATABASE_URL) — для скриптов и кода, которому не важен пользователь
+    @property
+    def engine(self) -> AsyncEngine:
+        return self.shards[0].engine
+
+    @property
+    def session_factory(self) -> async_sessionmaker[AsyncSession]:
+        return self.shards[0].session_factory
+
+    @property
+    def read_session_factory(self) -> async_sessionmaker[AsyncSession]:
+        return self.shards[0].read_session_factory
+
+    # ── Маршрутизация по пользователю ──────────────────────────────────────
+
+    def shard_for(self, user_id: int | None) -> Shard:
+        if user_id is None or len(self.shards) == 1:
+            return self.shards[0]
+        return self.shards[jump_hash(user_id, len(self.shards))]
+
+    def writer(self, user_id: int | None = None) -> async_sessionmaker[AsyncSession]:
+        """Фабрика пишущих сессий на primary шарда пользователя."""
+        return self.shard_for(user_id).session_factory
+
+    def reader(self, user_id: int | None = None) -> async_sessionmaker[AsyncSession]:
+        """Фабрика читающих сессий на шарде пользователя (см. Shard.reader)."""
+        return self.shard_for(user_id).reader(user_id)
+
+    def note_session_end(self, session: AsyncSession, user_id: int | None) -> None:
+        """Вызывать по завершении пишущей сессии: закрепляет пользователя за primary после коммита."""
+        if user_id is not None and session.info.get("committed_writes"):
+            self.shard_for(user_id).pin_primary(user_id)
+
+    # ── Обслуживание ───────────────────────────────────────────────────────
+
+    async def warmup(self, connections: int) -> None:
+        """Заранее открыть N соединений, чтобы первые апдейты не ждали handshake."""
+        await asyncio.gather(
+            *(_warmup_engine(engine, connections) for shard in self.shards for engine in shard.engines)
         )
 
+    def pool_stats(self) -> PoolStats:
+        return _engine_stats(self.engine)
+
+    def stats(self) -> list[dict]:
+        return [shard.stats() for shard in self.shards]
+
     async def dispose(self):
-        await self.engine.dispose()
+        for shard in self.shards:
+            await shard.dispose()
 
     async def session_getter(self) -> AsyncSession:
         async with self.session_factory() as session:
             yield session
 
-db_helper = DatabaseHelper(config.DATABASE_URL)
+
+async def _warmup_engine(engine: AsyncEngine, connections: int) -> None:
+    if connections <= 0 or not isinstance(engine.pool, InstrumentedPool):
+        return
+    connections = min(connections, engine.pool.size())
+
+    async def _touch():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(_touch() for _ in range(connections)))
+
+
+def _engine_stats(engine: AsyncEngine) -> PoolStats:
+    pool = engine.pool
+    if not isinstance(pool, InstrumentedPool):
+        return PoolStats(0, 0, 0, 0, 0, 0, 0.0, 0.0)
+    avg = pool.connect_total / pool.connects if pool.connects else 0.0
+    return PoolStats(
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=max(pool.overflow(), 0),
+        waiting=pool.waiting,
+        connects=pool.connects,
+        connect_avg_ms=avg * 1000,
+        connect_max_ms=pool.connect_max * 1000,
+    )
+
+db_helper = DatabaseHelper(
+    config.DATABASE_URL,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    read_mode=config.DB_READ_MODE,
+    replica_urls=config.replica_urls,
+    primary_pin_seconds=config.DB_PRIMARY_PIN_SECONDS,
+    shard_urls=config.shard_urls,
+)
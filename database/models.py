@@ -1,5 +1,5 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import BigInteger, String, ForeignKey, Numeric, Date, Boolean, DateTime, func
+from sqlalchemy import BigInteger, SmallInteger, String, Text, Integer, ForeignKey, Numeric, Date, Boolean, DateTime, Float, Index, func
 from datetime import date, datetime
 from decimal import Decimal
 
@@ -13,17 +13,29 @@ class User(Base):
     username: Mapped[str | None] = mapped_column(String)
     full_name: Mapped[str | None] = mapped_column(String)
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    # С какого момента бот не может писать пользователю (заблокировал бота, чат удалён).
+    # NULL — доступен; сбрасывается при любом входящем апдейте от пользователя
+    unreachable_since: Mapped[datetime | None] = mapped_column(DateTime)
 
     categories: Mapped[list["Category"]] = relationship(back_populates="user", cascade="all, delete-orphan")
     subscriptions: Mapped[list["Subscription"]] = relationship(back_populates="user", cascade="all, delete-orphan")
     settings: Mapped["NotificationSettings"] = relationship(back_populates="user", cascade="all, delete-orphan")
 
+# Недоступных пользователей мало: рассылки исключают их по этому маленькому индексу
+Index(
+    "ix_users_unreachable",
+    User.id,
+    postgresql_where=User.unreachable_since.isnot(None),
+)
+
 class Category(Base):
     __tablename__ = "categories"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     name: Mapped[str] = mapped_column(String)
+    # Меняется при каждом UPDATE: по нему web/routes/reports.py проверяет, устарел ли прогноз
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
 
     user: Mapped["User"] = relationship(back_populates="categories")
     subscriptions: Mapped[list["Subscription"]] = relationship(back_populates="category")
@@ -37,9 +49,16 @@ class Subscription(Base):
     name: Mapped[str] = mapped_column(String)
     price: Mapped[Decimal] = mapped_column(Numeric(10, 2))
     period: Mapped[str] = mapped_column(String) # 'monthly', 'yearly'
-    next_payment: Mapped[date] = mapped_column(Date)
+    next_payment: Mapped[date] = mapped_column(Date, index=True)
+    # День месяца, в который идут списания (31 — в конце коротких месяцев, см. services/occurrences.py);
+    # NULL у старых записей — день next_payment
+    anchor_day: Mapped[int | None] = mapped_column(SmallInteger)
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    # Меняется при каждом UPDATE, в том числе массовом (см. Category.updated_at)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, server_default="true")
+    # Свои сроки напоминаний (маска, как NotificationSettings.lead_days); NULL — как в настройках
+    lead_days: Mapped[int | None] = mapped_column(Integer)
 
     user: Mapped["User"] = relationship(back_populates="subscriptions")
     category: Mapped["Category"] = relationship(back_populates="subscriptions")
@@ -51,5 +70,90 @@ class NotificationSettings(Base):
     day_before: Mapped[bool] = mapped_column(Boolean, default=True)
     weekly: Mapped[bool] = mapped_column(Boolean, default=True)
     monthly: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Уведомления приходят в notify_hour по местному времени пользователя (IANA-имя пояса)
+    timezone: Mapped[str] = mapped_column(String, default="Europe/Moscow", server_default="Europe/Moscow")
+    notify_hour: Mapped[int] = mapped_column(Integer, default=12, server_default="12")
+    # За сколько дней до списания напоминать: битовая маска, бит N — за N дней (2 — только за день)
+    lead_days: Mapped[int] = mapped_column(Integer, default=2, server_default="2")
 
     user: Mapped["User"] = relationship(back_populates="settings")
+
+class SendBudget(Base):
+    """Общий для всех процессов бюджет отправок в Telegram (см. services/send_budget.py)."""
+    __tablename__ = "send_budget"
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float)
+    # Время в секундах epoch по часам БД, чтобы все процессы считали одинаково
+    updated_at: Mapped[float] = mapped_column(Float)
+    paused_until: Mapped[float] = mapped_column(Float, default=0.0, server_default="0")
+
+class NotificationLedger(Base):
+    """
+    Что уже отправлено (поставлено в очередь): одна строка на пользователя, вид
+    уведомления, период и подписку. Повторный запуск задачи не дублирует сообщения.
+    """
+    __tablename__ = "notification_ledger"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    kind: Mapped[str] = mapped_column(String, primary_key=True)  # 'day_before', 'weekly', 'monthly'
+    period_key: Mapped[str] = mapped_column(String, primary_key=True)  # '2026-10-18', '2026-W42', '2026-10'
+    subscription_id: Mapped[int] = mapped_column(Integer, primary_key=True, default=0)  # 0 — уведомление на весь период
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+class OutboxMessage(Base):
+    """Готовое к отправке уведомление; очередь разбирает services/outbox.py."""
+    __tablename__ = "notification_outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    kind: Mapped[str] = mapped_column(String)  # виды уведомлений через "+", напр. 'day_before+weekly'
+    body: Mapped[str] = mapped_column(Text)
+    status: Mapped[str] = mapped_column(String, default="pending", server_default="pending")  # 'pending', 'sent', 'failed'
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # Когда сообщение можно (снова) взять в работу: отложенные повторы и аренда воркером
+    available_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime)
+    last_error: Mapped[str | None] = mapped_column(String)
+
+Index(
+    "ix_notification_outbox_pending",
+    OutboxMessage.available_at,
+    postgresql_where=OutboxMessage.status == "pending",
+)
+Index(
+    "ix_notification_outbox_finished",
+    OutboxMessage.finished_at,
+    postgresql_where=OutboxMessage.status != "pending",
+)
+
+class JobRunUnit(Base):
+    """
+    Часть ежедневного прогона: пользователи с user_id % units == unit.
+    Части разбирают параллельно несколько воркеров (см. services/job_units.py).
+    """
+    __tablename__ = "job_run_units"
+
+    run_key: Mapped[str] = mapped_column(String, primary_key=True)  # напр. 'daily:2026-10-17'
+    unit: Mapped[int] = mapped_column(Integer, primary_key=True)
+    units: Mapped[int] = mapped_column(Integer)
+    status: Mapped[str] = mapped_column(String, default="pending", server_default="pending")  # 'pending', 'running', 'done', 'failed'
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    lease_until: Mapped[datetime | None] = mapped_column(DateTime)  # после этого момента зависшую часть можно забрать
+    started_at: Mapped[datetime | None] = mapped_column(DateTime)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime)
+    advanced: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    queued: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    last_error: Mapped[str | None] = mapped_column(String)
+
+class SchedulerJobState(Base):
+    """
+    Когда задача планировщика последний раз отработала. По этим отметкам новый
+    лидер после рестарта или деплоя догоняет пропущенные запуски (см. services/scheduler.py).
+    """
+    __tablename__ = "scheduler_job_state"
+
+    job_id: Mapped[str] = mapped_column(String, primary_key=True)  # 'notifications', 'outbox_purge'
+    last_run_at: Mapped[datetime] = mapped_column(DateTime)  # начало последнего запуска, UTC
+    finished_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
@@ -65,7 +65,7 @@ async def _get_user_cats(session: AsyncSession, user_id: int) -> list[Category]:
     return list(result.scalars().all())
 
 
-@router.callback_query(F.data == "categories")
+@router.callback_query(F.data == "categories", flags={"db": "read"})
 async def show_categories(callback: CallbackQuery, session: AsyncSession, state: FSMContext) -> None:
     await state.clear()
     cats = await _get_user_cats(session, callback.from_user.id)
@@ -85,7 +85,7 @@ async def show_categories(callback: CallbackQuery, session: AsyncSession, state:
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("cat_detail:"))
+@router.callback_query(F.data.startswith("cat_detail:"), flags={"db": "read"})
 async def show_cat_detail(callback: CallbackQuery, session: AsyncSession) -> None:
     cat_id = int(callback.data.split(":")[1])
     cat = await session.get(Category, cat_id)
@@ -112,7 +112,7 @@ async def show_cat_detail(callback: CallbackQuery, session: AsyncSession) -> Non
     await callback.answer()
 
 
-@router.callback_query(F.data == "add_category")
+@router.callback_query(F.data == "add_category", flags={"db": False})
 async def add_category_start(callback: CallbackQuery, state: FSMContext) -> None:
     await state.set_state(ManageCategories.name)
     await callback.message.edit_text(
@@ -160,7 +160,7 @@ async def add_category_save(message: Message, state: FSMContext, session: AsyncS
     )
 
 
-@router.callback_query(F.data.startswith("delete_cat_ask:"))
+@router.callback_query(F.data.startswith("delete_cat_ask:"), flags={"db": "read"})
 async def delete_cat_ask(callback: CallbackQuery, session: AsyncSession) -> None:
     cat_id = int(callback.data.split(":")[1])
     cat = await session.get(Category, cat_id)
@@ -23,6 +23,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Subscription
+from services.occurrences import sub_occurrences_between
 
 router = Router()
 
@@ -92,41 +93,6 @@ async def _get_user_subs(session: AsyncSession, user_id: int) -> list[Subscripti
     return list(result.scalars().all())
 
 
-def _subs_in_month(subs: list[Subscription], year: int, month: int) -> tuple[list[Subscription], list[Subscription]]:
-    """Split subscriptions into (upcoming, already_passed) for the given year/month."""
-    today = date.today()
-    first_day = date(year, month, 1)
-    last_day = date(year, month, calendar.monthrange(year, month)[1])
-
-    upcoming: list[Subscription] = []
-    passed: list[Subscription] = []
-
-    for sub in subs:
-        # Check if next_payment falls in [first_day, last_day]
-        np = sub.next_payment
-        if first_day <= np <= last_day:
-            if np < today or (year < today.year) or (year == today.year and month < today.month):
-                passed.append(sub)
-            else:
-                upcoming.append(sub)
-        # For past months — all subs that *would have* been due
-        # For future months — estimate based on period
-        elif year > today.year or (year == today.year and month > today.month):
-            # Future month — use period to estimate
-            sub_np = sub.next_payment
-            while sub_np < first_day:
-                if sub.period == "monthly":
-                    from dateutil.relativedelta import relativedelta as rd
-                    sub_np = sub_np + rd(months=1)
-                else:
-                    from dateutil.relativedelta import relativedelta as rd
-                    sub_np = sub_np + rd(years=1)
-            if first_day <= sub_np <= last_day:
-                upcoming.append(sub)
-
-    return upcoming, passed
-
-
 def _build_month_report(
     subs: list[Subscription],
     year: int,
@@ -144,34 +110,21 @@ def _build_month_report(
     total = Decimal("0")
 
     for sub in subs:
-        # Find the payment date for this month
-        payment_date: date | None = None
-        candidate = sub.next_payment
-
         if is_future:
-            # Advance candidate to target month
-            from dateutil.relativedelta import relativedelta as rd
-            while candidate < first_day:
-                if sub.period == "monthly":
-                    candidate += rd(months=1)
-                else:
-                    candidate += rd(years=1)
-            if first_day <= candidate <= last_day:
-                payment_date = candidate
+            # Project the series forward to the target month
+            payment_dates = sub_occurrences_between(sub, first_day, last_day)
+        elif first_day <= sub.next_payment <= last_day:
+            # Current or past month: only the stored next_payment counts
+            payment_dates = [sub.next_payment]
         else:
-            # Current or past month: use stored next_payment if in range, else skip
-            if first_day <= candidate <= last_day:
-                payment_date = candidate
-
-        if payment_date is None:
             continue
 
-        total += sub.price
-
-        if is_current and payment_date < today:
-            passed.append((payment_date, sub))
-        else:
-            upcoming.append((payment_date, sub))
+        for payment_date in payment_dates:
+            total += sub.price
+            if is_current and payment_date < today:
+                passed.append((payment_date, sub))
+            else:
+                upcoming.append((payment_date, sub))
 
     upcoming.sort(key=lambda x: x[0])
     passed.sort(key=lambda x: x[0])
@@ -229,7 +182,7 @@ def _build_monthly_total(subs: list[Subscription]) -> str:
 # Handlers
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data == "reports")
+@router.callback_query(F.data == "reports", flags={"db": False})
 async def show_reports_menu(callback: CallbackQuery) -> None:
     await callback.message.edit_text(
         "📊 <b>Отчёты</b>\n\nВыбери тип отчёта:",
@@ -239,7 +192,7 @@ async def show_reports_menu(callback: CallbackQuery) -> None:
     await callback.answer()
 
 
-@router.callback_query(F.data == "report_this_month")
+@router.callback_query(F.data == "report_this_month", flags={"db": "read"})
 async def report_this_month(callback: CallbackQuery, session: AsyncSession) -> None:
     today = date.today()
     subs = await _get_user_subs(session, callback.from_user.id)
@@ -252,7 +205,7 @@ async def report_this_month(callback: CallbackQuery, session: AsyncSession) -> N
     await callback.answer()
 
 
-@router.callback_query(F.data == "report_next_month")
+@router.callback_query(F.data == "report_next_month", flags={"db": "read"})
 async def report_next_month(callback: CallbackQuery, session: AsyncSession) -> None:
     today = date.today()
     if today.month == 12:
@@ -270,7 +223,7 @@ async def report_next_month(callback: CallbackQuery, session: AsyncSession) -> N
     await callback.answer()
 
 
-@router.callback_query(F.data == "report_monthly_total")
+@router.callback_query(F.data == "report_monthly_total", flags={"db": "read"})
 async def report_monthly_total(callback: CallbackQuery, session: AsyncSession) -> None:
     subs = await _get_user_subs(session, callback.from_user.id)
     text = _build_monthly_total(subs)
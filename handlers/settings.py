@@ -2,9 +2,12 @@
 handlers/settings.py — Notification settings management.
 
 Allows users to toggle:
-- day_before: reminder the day before a payment
+- day_before: payment reminders (the day before, or at the chosen lead times)
 - weekly: Monday digest of upcoming payments
 - monthly: monthly expense summary
+
+to choose how many days ahead reminders come (LEAD_DAY_CHOICES), and the
+local hour (and time zone) notifications arrive at.
 """
 from __future__ import annotations
 
@@ -18,10 +21,30 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import NotificationSettings
+from services.lead_days import LEAD_DAY_CHOICES, lead_days_list
+from services.reminders import notify_reminders_changed
 
 router = Router()
 
 
+# Часовые пояса России, из которых можно выбрать в настройках
+TIMEZONES: dict[str, str] = {
+    "Europe/Kaliningrad": "Калининград (UTC+2)",
+    "Europe/Moscow": "Москва (UTC+3)",
+    "Europe/Samara": "Самара (UTC+4)",
+    "Asia/Yekaterinburg": "Екатеринбург (UTC+5)",
+    "Asia/Omsk": "Омск (UTC+6)",
+    "Asia/Novosibirsk": "Новосибирск (UTC+7)",
+    "Asia/Irkutsk": "Иркутск (UTC+8)",
+    "Asia/Yakutsk": "Якутск (UTC+9)",
+    "Asia/Vladivostok": "Владивосток (UTC+10)",
+    "Asia/Magadan": "Магадан (UTC+11)",
+    "Asia/Kamchatka": "Камчатка (UTC+12)",
+}
+# Рассылка растянута на первые 45 минут часа, поэтому 23:00 не предлагаем
+NOTIFY_HOURS = range(6, 23)
+
+
 def _check(enabled: bool) -> str:
     return "✅" if enabled else "☑️"
 
@@ -31,10 +54,16 @@ def settings_keyboard(ns: NotificationSettings) -> InlineKeyboardMarkup:
         inline_keyboard=[
             [
                 InlineKeyboardButton(
-                    text=f"{_check(ns.day_before)} За день до списания",
+                    text=f"{_check(ns.day_before)} Напоминания о списаниях",
                     callback_data="toggle_day_before",
                 )
             ],
+            [
+                InlineKeyboardButton(
+                    text=f"🔔 За сколько дней: {', '.join(map(str, lead_days_list(ns.lead_days)))}",
+                    callback_data="settings_leads",
+                )
+            ],
             [
                 InlineKeyboardButton(
                     text=f"{_check(ns.weekly)} Еженедельный дайджест (Пн)",
@@ -47,6 +76,18 @@ def settings_keyboard(ns: NotificationSettings) -> InlineKeyboardMarkup:
                     callback_data="toggle_monthly",
                 )
             ],
+            [
+                InlineKeyboardButton(
+                    text=f"🕘 Время: {ns.notify_hour:02d}:00",
+                    callback_data="settings_hour",
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    text=f"🌍 Пояс: {TIMEZONES.get(ns.timezone, ns.timezone)}",
+                    callback_data="settings_tz",
+                )
+            ],
             [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")],
         ]
     )
@@ -82,6 +123,7 @@ async def show_settings(callback: CallbackQuery, session: AsyncSession) -> None:
 async def toggle_day_before(callback: CallbackQuery, session: AsyncSession) -> None:
     ns = await _get_or_create_settings(session, callback.from_user.id)
     ns.day_before = not ns.day_before
+    await notify_reminders_changed(session, ns.user_id)
     await session.commit()
     await callback.message.edit_reply_markup(reply_markup=settings_keyboard(ns))
     status = "включены" if ns.day_before else "отключены"
@@ -106,3 +148,101 @@ async def toggle_monthly(callback: CallbackQuery, session: AsyncSession) -> None
     await callback.message.edit_reply_markup(reply_markup=settings_keyboard(ns))
     status = "включён" if ns.monthly else "отключён"
     await callback.answer(f"Ежемесячный отчёт {status}.")
+
+
+def leads_keyboard(ns: NotificationSettings) -> InlineKeyboardMarkup:
+    leads = lead_days_list(ns.lead_days)
+    rows = [
+        [InlineKeyboardButton(text=f"{_check(day in leads)} За {day} дн.", callback_data=f"toggle_lead:{day}")]
+        for day in LEAD_DAY_CHOICES
+    ]
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="settings")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+@router.callback_query(F.data == "settings_leads")
+async def choose_leads(callback: CallbackQuery, session: AsyncSession) -> None:
+    ns = await _get_or_create_settings(session, callback.from_user.id)
+    await callback.message.edit_text(
+        "🔔 <b>За сколько дней напоминать о списании?</b>\n\n"
+        "Можно выбрать несколько вариантов.",
+        reply_markup=leads_keyboard(ns),
+        parse_mode="HTML",
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("toggle_lead:"))
+async def toggle_lead(callback: CallbackQuery, session: AsyncSession) -> None:
+    day = int(callback.data.split(":", 1)[1])
+    if day not in LEAD_DAY_CHOICES:
+        await callback.answer("Такой срок выбрать нельзя.", show_alert=True)
+        return
+    ns = await _get_or_create_settings(session, callback.from_user.id)
+    mask = ns.lead_days ^ (1 << day)
+    if not lead_days_list(mask):
+        await callback.answer("Нужен хотя бы один срок.", show_alert=True)
+        return
+    ns.lead_days = mask
+    await notify_reminders_changed(session, ns.user_id)
+    await session.commit()
+    await callback.message.edit_reply_markup(reply_markup=leads_keyboard(ns))
+    await callback.answer()
+
+
+@router.callback_query(F.data == "settings_hour", flags={"db": False})
+async def choose_hour(callback: CallbackQuery) -> None:
+    hours = [
+        InlineKeyboardButton(text=f"{hour:02d}:00", callback_data=f"set_hour:{hour}")
+        for hour in NOTIFY_HOURS
+    ]
+    rows = [hours[i:i + 4] for i in range(0, len(hours), 4)]
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="settings")])
+    await callback.message.edit_text(
+        "🕘 <b>Во сколько присылать уведомления?</b>\n\n"
+        "Время местное, по выбранному часовому поясу.",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=rows),
+        parse_mode="HTML",
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("set_hour:"))
+async def set_hour(callback: CallbackQuery, session: AsyncSession) -> None:
+    hour = int(callback.data.split(":", 1)[1])
+    if hour not in NOTIFY_HOURS:
+        await callback.answer("Такое время выбрать нельзя.", show_alert=True)
+        return
+    ns = await _get_or_create_settings(session, callback.from_user.id)
+    ns.notify_hour = hour
+    await notify_reminders_changed(session, ns.user_id)
+    await session.commit()
+    await show_settings(callback, session)
+
+
+@router.callback_query(F.data == "settings_tz", flags={"db": False})
+async def choose_timezone(callback: CallbackQuery) -> None:
+    rows = [
+        [InlineKeyboardButton(text=label, callback_data=f"set_tz:{name}")]
+        for name, label in TIMEZONES.items()
+    ]
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="settings")])
+    await callback.message.edit_text(
+        "🌍 <b>Выбери часовой пояс</b>",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=rows),
+        parse_mode="HTML",
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("set_tz:"))
+async def set_timezone(callback: CallbackQuery, session: AsyncSession) -> None:
+    name = callback.data.split(":", 1)[1]
+    if name not in TIMEZONES:
+        await callback.answer("Неизвестный часовой пояс.", show_alert=True)
+        return
+    ns = await _get_or_create_settings(session, callback.from_user.id)
+    ns.timezone = name
+    await notify_reminders_changed(session, ns.user_id)
+    await session.commit()
+    await show_settings(callback, session)
@@ -3,16 +3,18 @@ handlers/start.py — /start command, /help command, main menu keyboard,
 and the universal "back_to_main" callback.
 """
 from aiogram import Router, F
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, ChatMemberUpdatedFilter, KICKED
 from aiogram.types import (
     Message,
     CallbackQuery,
+    ChatMemberUpdated,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
 )
 from aiogram.fsm.context import FSMContext
 
-from services.user_service import get_or_create_user
+from services.reminders import notify_reminders_changed
+from services.user_service import get_or_create_user, mark_reachable, mark_unreachable
 
 router = Router()
 
@@ -65,6 +67,10 @@ HELP_TEXT = (
 async def cmd_start(message: Message, session, state: FSMContext) -> None:
     """Handle /start — register user if new, show main menu."""
     await state.clear()
+    # Вернулся после блокировки — снова получает уведомления
+    if await mark_reachable(session, message.from_user.id):
+        await notify_reminders_changed(session, message.from_user.id)
+        await session.commit()
     await get_or_create_user(
         session=session,
         telegram_id=message.from_user.id,
@@ -74,13 +80,20 @@ async def cmd_start(message: Message, session, state: FSMContext) -> None:
     await message.answer(WELCOME_TEXT, reply_markup=build_main_menu(), parse_mode="HTML")
 
 
-@router.message(Command("help"))
+@router.my_chat_member(ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def bot_blocked(event: ChatMemberUpdated, session) -> None:
+    """The user blocked the bot — stop planning notifications for them."""
+    await mark_unreachable(session, [event.from_user.id])
+    await session.commit()
+
+
+@router.message(Command("help"), flags={"db": False})
 async def cmd_help(message: Message) -> None:
     """Handle /help — show feature overview."""
     await message.answer(HELP_TEXT, parse_mode="HTML")
 
 
-@router.callback_query(F.data == "back_to_main")
+@router.callback_query(F.data == "back_to_main", flags={"db": False})
 async def back_to_main(callback: CallbackQuery, state: FSMContext) -> None:
     """Universal 'back to main menu' callback."""
     await state.clear()
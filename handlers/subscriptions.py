@@ -25,11 +25,11 @@ from aiogram.types import (
     InlineKeyboardMarkup,
     Message,
 )
-from dateutil.relativedelta import relativedelta
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Category, Subscription
+from services.reminders import notify_reminders_changed
 from utils.states import AddSubscription, EditSubscription
 
 router = Router()
@@ -271,7 +271,7 @@ def _build_detail_text(sub: Subscription, cat_name: str | None) -> str:
 # "My subscriptions" list
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data == "my_subs")
+@router.callback_query(F.data == "my_subs", flags={"db": "read"})
 async def show_subscriptions(callback: CallbackQuery, session: AsyncSession, state: FSMContext) -> None:
     await state.clear()
     subs = await _get_user_subs(session, callback.from_user.id)
@@ -285,7 +285,7 @@ async def show_subscriptions(callback: CallbackQuery, session: AsyncSession, sta
 # Subscription detail
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data.startswith("sub_detail:"))
+@router.callback_query(F.data.startswith("sub_detail:"), flags={"db": "read"})
 async def show_sub_detail(callback: CallbackQuery, session: AsyncSession, state: FSMContext) -> None:
     await state.clear()
     sub_id = int(callback.data.split(":")[1])
@@ -318,6 +318,7 @@ async def toggle_active(callback: CallbackQuery, session: AsyncSession) -> None:
         return
 
     sub.is_active = not sub.is_active
+    await notify_reminders_changed(session, sub.user_id)
     await session.commit()
 
     status_text = "возобновлена ▶️" if sub.is_active else "приостановлена ⏸"
@@ -336,7 +337,7 @@ async def toggle_active(callback: CallbackQuery, session: AsyncSession) -> None:
 # Edit menu (submenu)
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data.startswith("edit_sub_menu:"))
+@router.callback_query(F.data.startswith("edit_sub_menu:"), flags={"db": "read"})
 async def show_edit_menu(callback: CallbackQuery, session: AsyncSession) -> None:
     sub_id = int(callback.data.split(":")[1])
     sub = await session.get(Subscription, sub_id)
@@ -356,7 +357,7 @@ async def show_edit_menu(callback: CallbackQuery, session: AsyncSession) -> None
 # Edit: NAME
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data.startswith("edit_sub_name:"))
+@router.callback_query(F.data.startswith("edit_sub_name:"), flags={"db": False})
 async def edit_name_ask(callback: CallbackQuery, state: FSMContext) -> None:
     sub_id = int(callback.data.split(":")[1])
     await state.update_data(sub_id=sub_id)
@@ -403,7 +404,7 @@ async def edit_name_save(message: Message, state: FSMContext, session: AsyncSess
 # Edit: PRICE
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data.startswith("edit_sub_price:"))
+@router.callback_query(F.data.startswith("edit_sub_price:"), flags={"db": False})
 async def edit_price_ask(callback: CallbackQuery, state: FSMContext) -> None:
     sub_id = int(callback.data.split(":")[1])
     await state.update_data(sub_id=sub_id)
@@ -455,7 +456,7 @@ async def edit_price_save(message: Message, state: FSMContext, session: AsyncSes
 # Edit: PERIOD
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data.startswith("edit_sub_period:"))
+@router.callback_query(F.data.startswith("edit_sub_period:"), flags={"db": False})
 async def edit_period_ask(callback: CallbackQuery, state: FSMContext) -> None:
     sub_id = int(callback.data.split(":")[1])
     await state.update_data(sub_id=sub_id)
@@ -497,7 +498,7 @@ async def edit_period_save(callback: CallbackQuery, state: FSMContext, session:
 # Edit: NEXT PAYMENT DATE
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data.startswith("edit_sub_date:"))
+@router.callback_query(F.data.startswith("edit_sub_date:"), flags={"db": False})
 async def edit_date_ask(callback: CallbackQuery, state: FSMContext) -> None:
     sub_id = int(callback.data.split(":")[1])
     await state.update_data(sub_id=sub_id)
@@ -535,6 +536,9 @@ async def edit_date_save(message: Message, state: FSMContext, session: AsyncSess
         return
 
     sub.next_payment = new_date
+    # Новая дата задаёт и день месяца для следующих списаний
+    sub.anchor_day = new_date.day
+    await notify_reminders_changed(session, sub.user_id)
     await session.commit()
     await state.clear()
 
@@ -551,7 +555,7 @@ async def edit_date_save(message: Message, state: FSMContext, session: AsyncSess
 # Edit: CATEGORY
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data.startswith("edit_sub_cat:"))
+@router.callback_query(F.data.startswith("edit_sub_cat:"), flags={"db": "read"})
 async def edit_cat_ask(callback: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     sub_id = int(callback.data.split(":")[1])
     await state.update_data(sub_id=sub_id)
@@ -613,7 +617,7 @@ async def edit_cat_save(callback: CallbackQuery, state: FSMContext, session: Asy
 # Delete with confirmation
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data.startswith("delete_sub_ask:"))
+@router.callback_query(F.data.startswith("delete_sub_ask:"), flags={"db": "read"})
 async def delete_sub_ask(callback: CallbackQuery, session: AsyncSession) -> None:
     sub_id = int(callback.data.split(":")[1])
     sub = await session.get(Subscription, sub_id)
@@ -639,6 +643,7 @@ async def delete_sub_confirm(callback: CallbackQuery, session: AsyncSession, sta
 
     name = sub.name
     await session.delete(sub)
+    await notify_reminders_changed(session, sub.user_id)
     await session.commit()
     await state.clear()
 
@@ -657,7 +662,7 @@ async def delete_sub_confirm(callback: CallbackQuery, session: AsyncSession, sta
 # ADD SUBSCRIPTION flow
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.callback_query(F.data == "add_sub")
+@router.callback_query(F.data == "add_sub", flags={"db": False})
 async def add_sub_start(callback: CallbackQuery, state: FSMContext) -> None:
     await state.clear()
     await state.set_state(AddSubscription.name)
@@ -671,7 +676,7 @@ async def add_sub_start(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.answer()
 
 
-@router.message(StateFilter(AddSubscription.name))
+@router.message(StateFilter(AddSubscription.name), flags={"db": False})
 async def add_sub_name(message: Message, state: FSMContext) -> None:
     name = message.text.strip()
     if not name:
@@ -685,7 +690,7 @@ async def add_sub_name(message: Message, state: FSMContext) -> None:
     )
 
 
-@router.message(StateFilter(AddSubscription.price))
+@router.message(StateFilter(AddSubscription.price), flags={"db": False})
 async def add_sub_price(message: Message, state: FSMContext) -> None:
     raw = message.text.strip().replace(",", ".")
     try:
@@ -704,7 +709,7 @@ async def add_sub_price(message: Message, state: FSMContext) -> None:
     )
 
 
-@router.callback_query(F.data.startswith("set_add_period:"), StateFilter(AddSubscription.period))
+@router.callback_query(F.data.startswith("set_add_period:"), StateFilter(AddSubscription.period), flags={"db": "read"})
 async def add_sub_period(callback: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     period = callback.data.split(":")[1]
     await state.update_data(period=period)
@@ -726,7 +731,7 @@ async def add_sub_period(callback: CallbackQuery, state: FSMContext, session: As
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("add_cat:"), StateFilter(AddSubscription.category))
+@router.callback_query(F.data.startswith("add_cat:"), StateFilter(AddSubscription.category), flags={"db": False})
 async def add_sub_category(callback: CallbackQuery, state: FSMContext) -> None:
     cat_id_raw = int(callback.data.split(":")[1])
     await state.update_data(category_id=None if cat_id_raw == 0 else cat_id_raw)
@@ -759,8 +764,10 @@ async def add_sub_next_payment(message: Message, state: FSMContext, session: Asy
         period=data["period"],
         category_id=data.get("category_id"),
         next_payment=next_payment,
+        anchor_day=next_payment.day,
     )
     session.add(sub)
+    await notify_reminders_changed(session, sub.user_id)
     await session.commit()
     await state.clear()
 
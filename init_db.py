@@ -8,8 +8,9 @@ from database.models import Base
 
 async def init_db():
     """Создает все таблицы в базе данных"""
-    async with db_helper.engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    for shard in db_helper.shards:
+        async with shard.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
     print("✅ Таблицы успешно созданы!")
     await db_helper.dispose()
 
@@ -1,9 +1,50 @@
 from typing import Callable, Awaitable, Any
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import TelegramObject
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from database.db_helper import db_helper
 
+# Флаг хендлера: flags={"db": False} — хендлер не ходит в БД,
+# flags={"db": "read"} — только читает (сессия без транзакции на запись)
+DB_FLAG = "db"
+DB_READ = "read"
+
+
+class LazySession:
+    """
+    Прокси над AsyncSession: настоящая сессия создаётся при первом обращении
+    (execute, get, add, commit, ...). Апдейты, которые не трогают БД,
+    не создают сессию и не занимают соединение из пула.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+        self._session_factory = session_factory
+        self._session: AsyncSession | None = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    def use_factory(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        """Сменить фабрику, пока сессия ещё не открыта (иначе ничего не делает)."""
+        if self._session is None:
+            self._session_factory = session_factory
+
+    def _get(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_factory()
+        return self._session
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get(), name)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
 class DbSessionMiddleware(BaseMiddleware):
     async def __call__(
         self,
@@ -11,6 +52,45 @@ class DbSessionMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: dict[str, Any],
     ) -> Any:
-        async with db_helper.session_factory() as session:
-            data["session"] = session
+        user = data.get("event_from_user")
+        user_id = user.id if user else None
+        # Сессия сразу смотрит на шард пользователя
+        session = LazySession(db_helper.writer(user_id))
+        data["session"] = session
+        try:
             return await handler(event, data)
+        finally:
+            if session.opened:
+                db_helper.note_session_end(session, user_id)
+            await session.close()
+
+
+class DbFlagsMiddleware(BaseMiddleware):
+    """
+    Inner-мидлварь: применяет флаг "db" выбранного хендлера
+    (False — убрать сессию, "read" — открыть её в режиме только для чтения).
+
+    Регистрируется на dp.message / dp.callback_query. Чтобы объявить,
+    что целый роутер не ходит в БД, повесь её на роутер с default=False:
+        router.message.middleware(DbFlagsMiddleware(default=False))
+    """
+
+    def __init__(self, default: bool | str = True):
+        self.default = default
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        flag = get_flag(data, DB_FLAG, default=self.default)
+        if flag is False:
+            # Хендлер объявил, что БД ему не нужна — сессию не передаём вовсе
+            data.pop("session", None)
+        elif flag == DB_READ:
+            session = data.get("session")
+            if isinstance(session, LazySession):
+                user = data.get("event_from_user")
+                session.use_factory(db_helper.reader(user.id if user else None))
+        return await handler(event, data)
@@ -0,0 +1,95 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Awaitable, Any
+
+from aiogram import BaseMiddleware
+from aiogram.enums import ChatMemberStatus
+from aiogram.types import TelegramObject, Update
+
+from database.db_helper import db_helper
+from services.reminders import notify_reminders_changed
+from services.user_service import mark_reachable, marked_unreachable
+
+logger = logging.getLogger(__name__)
+
+# Как часто (сек) один и тот же пользователь проверяется повторно
+RECHECK_SECONDS = 600.0
+# Сколько недавно проверенных пользователей помнить
+MAX_TRACKED_USERS = 100_000
+
+
+def is_block_update(event: TelegramObject) -> bool:
+    """Апдейт о том, что пользователь заблокировал бота."""
+    return (
+        isinstance(event, Update)
+        and event.my_chat_member is not None
+        and event.my_chat_member.new_chat_member.status == ChatMemberStatus.KICKED
+    )
+
+
+class ReachabilityMiddleware(BaseMiddleware):
+    """
+    Любой апдейт от пользователя снимает отметку "недоступен"
+    (User.unreachable_since), которую ставят рассыльщики.
+
+    Пользователь, проверенный за последние RECHECK_SECONDS, считается
+    доступным без обращения к БД — так проходит почти каждый апдейт, в том
+    числе для хендлеров с флагом {"db": False}. Иначе отметка читается
+    с реплики (поиск по первичному ключу), и только у отмеченного
+    пользователя она снимается UPDATE на primary. Всё это — в отдельных
+    коротких сессиях: хендлер получает свою сессию нетронутой (ленивой,
+    с выбором чтения/записи). /start снимает отметку всегда.
+
+    Регистрируется на dp.update после DbSessionMiddleware.
+    """
+
+    def __init__(self, recheck_seconds: float = RECHECK_SECONDS, max_tracked: int = MAX_TRACKED_USERS):
+        self.recheck_seconds = recheck_seconds
+        self.max_tracked = max_tracked
+        # user_id -> время последней проверки, старые в начале
+        self._checked: OrderedDict[int, float] = OrderedDict()
+
+    def forget(self, user_id: int) -> None:
+        self._checked.pop(user_id, None)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            if is_block_update(event):
+                # Блокировка: отметку ставит хендлер, следующий апдейт проверим сразу
+                self.forget(user.id)
+            elif self._due(user.id):
+                await self._reactivate(user.id)
+        return await handler(event, data)
+
+    def _due(self, user_id: int) -> bool:
+        now = time.monotonic()
+        checked = self._checked.get(user_id)
+        if checked is not None and now - checked < self.recheck_seconds:
+            return False
+        self._checked[user_id] = now
+        self._checked.move_to_end(user_id)
+        while len(self._checked) > self.max_tracked:
+            self._checked.popitem(last=False)
+        return True
+
+    async def _reactivate(self, user_id: int) -> None:
+        try:
+            async with db_helper.reader(user_id)() as session:
+                if not await marked_unreachable(session, user_id):
+                    return
+            async with db_helper.writer(user_id)() as session:
+                if await mark_reachable(session, user_id):
+                    await notify_reminders_changed(session, user_id)
+                    await session.commit()
+                    logger.info("User %s is reachable again.", user_id)
+        except Exception as exc:
+            # Не мешаем обработке апдейта: проверим при следующем
+            self.forget(user_id)
+            logger.warning("Could not update reachability of user %s: %s", user_id, exc)
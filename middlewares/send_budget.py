@@ -0,0 +1,26 @@
+from typing import Callable, Awaitable, Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.send_budget import interactive_replies
+
+
+class InteractiveRepliesMiddleware(BaseMiddleware):
+    """
+    Ответы хендлеров не списываются из общего бюджета отправок
+    (services/send_budget.py): их не больше, чем входящих апдейтов, и
+    TELEGRAM_SEND_RATE оставляет под них запас до лимита Telegram. Так ответ
+    пользователю не ждёт UPDATE строки send_budget, общей для всех реплик.
+
+    Регистрируется первой: dp.update.outer_middleware(InteractiveRepliesMiddleware()).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        with interactive_replies():
+            return await handler(event, data)
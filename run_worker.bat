@@ -0,0 +1,5 @@
+@echo off
+REM Запуск воркера уведомлений (планировщик и рассылка без обработчиков бота)
+cd /d "%~dp0"
+python worker.py
+pause
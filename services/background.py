@@ -0,0 +1,178 @@
+"""
+services/background.py — Everything the bot runs besides answering updates.
+
+- the APScheduler jobs (services/scheduler.py) and the exact-time reminder
+  engine (services/reminders.py), both only on the replica elected leader
+  (services/leader.py); a new leader catches up missed runs
+- the outbox workers delivering queued notifications (services/outbox.py)
+
+worker.py runs this on its own, bot.py next to polling unless
+BOT_BACKGROUND_JOBS is off, so interactive and background capacity can be
+deployed and sized separately. Nothing here imports the handler routers.
+
+Usage:
+    send_bucket = create_send_bucket(
+        bot, db_helper.session_factory, config.SEND_BUDGET_STORE, config.TELEGRAM_SEND_RATE,
+    )
+    background = Background.from_config(bot, db_helper.shards, send_bucket, config)
+    await background.start()
+    ...
+    await background.stop()
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Sequence
+
+from aiogram import Bot
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from services.job_units import DEFAULT_UNITS, DEFAULT_WORKERS
+from services.leader import DEFAULT_RENEW_INTERVAL, LeaderElection
+from services.outbox import start_outbox_workers, stop_outbox_workers
+from services.reminders import RECONCILE_INTERVAL, ReminderEngine
+from services.scheduler import (
+    MISFIRE_GRACE_SECONDS,
+    NOTIFY_TICK_MINUTES,
+    catch_up_missed_jobs,
+    create_scheduler,
+)
+from services.send_budget import (
+    DistributedTokenBucket,
+    MemoryRateStore,
+    PostgresRateStore,
+    SendBudgetMiddleware,
+)
+from services.sender import GLOBAL_RATE
+
+if TYPE_CHECKING:
+    from database.db_helper import Shard
+
+logger = logging.getLogger(__name__)
+
+
+def create_send_bucket(
+    bot: Bot,
+    session_factory: async_sessionmaker[AsyncSession],
+    store: str = "postgres",
+    rate: float = GLOBAL_RATE,
+) -> DistributedTokenBucket:
+    """
+    The send budget for the bot's token, shared with every other process
+    using it ("postgres"), or kept in this process ("memory"). Every send
+    through `bot` is charged to it.
+    """
+    rate_store = PostgresRateStore(session_factory) if store == "postgres" else MemoryRateStore()
+    bucket = DistributedTokenBucket(rate_store, key=f"bot:{bot.id}", rate=rate)
+    bot.session.middleware(SendBudgetMiddleware(bucket))
+    return bucket
+
+
+class Background:
+    """Leader-only scheduler and reminder engine plus outbox workers on every shard."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        shards: Sequence[Shard],
+        send_bucket: DistributedTokenBucket,
+        units: int = DEFAULT_UNITS,
+        workers: int = DEFAULT_WORKERS,
+        tick_minutes: int = NOTIFY_TICK_MINUTES,
+        misfire_grace_seconds: int = MISFIRE_GRACE_SECONDS,
+        coalesce: bool = True,
+        leader_renew_seconds: float = DEFAULT_RENEW_INTERVAL,
+        outbox_workers: int = 1,
+        reminder_engine: bool = True,
+        reminder_reconcile_seconds: float = RECONCILE_INTERVAL,
+    ) -> None:
+        self.bot = bot
+        self.shards = list(shards)
+        self.send_bucket = send_bucket
+        self.outbox_workers = outbox_workers
+        self.use_reminder_engine = reminder_engine
+
+        # Scheduler state and the leader lock live on shard 0
+        self._state_factory = self.shards[0].session_factory
+        self.session_factories = [shard.session_factory for shard in self.shards]
+        self.scheduler = create_scheduler(
+            session_factories=self.session_factories,
+            units=units,
+            workers=workers,
+            tick_minutes=tick_minutes,
+            misfire_grace_seconds=misfire_grace_seconds,
+            coalesce=coalesce,
+            state_factory=self._state_factory,
+        )
+        self.reminders = ReminderEngine(self.shards, reconcile_interval=reminder_reconcile_seconds)
+        self.leader = LeaderElection(
+            self.shards[0].engine,
+            renew_interval=leader_renew_seconds,
+            on_elected=self._on_elected,
+            on_demoted=self._on_demoted,
+        )
+        self._leader_task: asyncio.Task | None = None
+        self._outbox_tasks: list[asyncio.Task] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_config(
+        cls,
+        bot: Bot,
+        shards: Sequence[Shard],
+        send_bucket: DistributedTokenBucket,
+        config: Any,
+    ) -> Background:
+        """Build from the application settings (config.Settings)."""
+        return cls(
+            bot,
+            shards,
+            send_bucket,
+            units=config.NOTIFY_JOB_UNITS,
+            workers=config.NOTIFY_JOB_WORKERS,
+            tick_minutes=config.NOTIFY_TICK_MINUTES,
+            misfire_grace_seconds=config.SCHEDULER_MISFIRE_GRACE_SECONDS,
+            coalesce=config.SCHEDULER_COALESCE,
+            leader_renew_seconds=config.LEADER_RENEW_SECONDS,
+            outbox_workers=config.OUTBOX_WORKERS,
+            reminder_engine=config.REMINDER_ENGINE,
+            reminder_reconcile_seconds=config.REMINDER_RECONCILE_SECONDS,
+        )
+
+    async def start(self) -> None:
+        # Every replica starts the scheduler paused; only the elected leader runs its jobs
+        self.scheduler.start(paused=True)
+        self._leader_task = asyncio.create_task(self.leader.run(), name="leader")
+        logger.info("Scheduler started, waiting for leadership.")
+        self._outbox_tasks = start_outbox_workers(
+            self.bot, self.session_factories, bucket=self.send_bucket, per_shard=self.outbox_workers,
+        )
+
+    async def stop(self) -> None:
+        if self._leader_task is not None:
+            self._leader_task.cancel()
+            await asyncio.gather(self._leader_task, return_exceptions=True)
+            self._leader_task = None
+        await self.leader.release()
+        await self.reminders.aclose()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        await stop_outbox_workers(self._outbox_tasks)
+        self._outbox_tasks = []
+
+    def _on_elected(self) -> None:
+        self.scheduler.resume()
+        # Runs missed while no replica was leading (restart, deploy) are made up once
+        task = asyncio.create_task(catch_up_missed_jobs(self.scheduler, self._state_factory))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if self.use_reminder_engine:
+            self.reminders.start()
+
+    def _on_demoted(self) -> None:
+        self.scheduler.pause()
+        self.reminders.stop()
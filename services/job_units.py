@@ -0,0 +1,225 @@
+"""
+services/job_units.py — Split a batch run into work units processed in parallel.
+
+A run (e.g. one tick of the notification job) is divided into
+`units` hash buckets of users, user_id % units == unit. Each bucket is a
+row in `job_run_units`:
+
+- create_run(session, run_key, units) — insert the run's units (idempotent)
+- work_units(session_factory, run_key, handler) — claim units one by one
+  with FOR UPDATE SKIP LOCKED and run `handler` on each until none are left
+
+Start as many work_units loops as needed, in one process or several: each
+unit is processed by exactly one of them. A claimed unit carries a lease;
+if its worker dies, another loop takes it over once the lease runs out.
+A failed unit goes back to pending until UNIT_MAX_ATTEMPTS is reached;
+a unit whose lease runs out on its last attempt is marked failed.
+Each unit records its attempts, timings, result counters and last error,
+so run_progress(session, run_key) shows how far a run has got;
+purge_runs(session) drops finished units after RUN_KEEP_DAYS.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import and_, case, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.models import JobRunUnit
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_UNITS = 16
+DEFAULT_WORKERS = 4
+UNIT_LEASE_SECONDS = 900
+UNIT_MAX_ATTEMPTS = 3
+RUN_KEEP_DAYS = 7
+
+_ERROR_MAX_LEN = 500
+LEASE_EXPIRED_ERROR = "lease expired on the last attempt"
+
+
+@dataclass
+class UnitResult:
+    """What a unit handler did; summed over units for the run report."""
+    advanced: int = 0
+    queued: int = 0
+
+    def __add__(self, other: UnitResult) -> UnitResult:
+        return UnitResult(self.advanced + other.advanced, self.queued + other.queued)
+
+
+# handler(part) processes the users of part = (unit, units)
+UnitHandler = Callable[[tuple[int, int]], Awaitable[UnitResult]]
+
+
+async def create_run(session: AsyncSession, run_key: str, units: int = DEFAULT_UNITS) -> None:
+    """Insert the run's units and commit; units that already exist are kept as they are."""
+    await session.execute(
+        pg_insert(JobRunUnit).on_conflict_do_nothing(),
+        [{"run_key": run_key, "unit": unit, "units": units} for unit in range(units)],
+    )
+    await session.commit()
+
+
+async def claim_unit(
+    session: AsyncSession,
+    run_key: str,
+    lease_seconds: float = UNIT_LEASE_SECONDS,
+    max_attempts: int = UNIT_MAX_ATTEMPTS,
+) -> tuple[int, int] | None:
+    """
+    Take the next pending (or abandoned) unit of the run and commit; None when
+    all are taken. Abandoned units that have used up their attempts are marked
+    failed on the way, so the run still finishes.
+    """
+    await session.execute(
+        update(JobRunUnit)
+        .where(
+            JobRunUnit.run_key == run_key,
+            JobRunUnit.status == RUNNING,
+            JobRunUnit.lease_until < func.now(),
+            JobRunUnit.attempts >= max_attempts,
+        )
+        .values(status=FAILED, finished_at=func.now(), lease_until=None, last_error=LEASE_EXPIRED_ERROR)
+        .execution_options(synchronize_session=False)
+    )
+    claimable = (
+        select(JobRunUnit.unit)
+        .where(
+            JobRunUnit.run_key == run_key,
+            or_(
+                JobRunUnit.status == PENDING,
+                # Its worker died: the lease ran out without the unit finishing
+                and_(
+                    JobRunUnit.status == RUNNING,
+                    JobRunUnit.lease_until < func.now(),
+                    JobRunUnit.attempts < max_attempts,
+                ),
+            ),
+        )
+        .order_by(JobRunUnit.unit)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    row = (
+        await session.execute(
+            update(JobRunUnit)
+            .where(JobRunUnit.run_key == run_key, JobRunUnit.unit == claimable)
+            .values(
+                status=RUNNING,
+                attempts=JobRunUnit.attempts + 1,
+                started_at=func.now(),
+                lease_until=func.now() + timedelta(seconds=lease_seconds),
+            )
+            .returning(JobRunUnit.unit, JobRunUnit.units)
+            .execution_options(synchronize_session=False)
+        )
+    ).first()
+    await session.commit()
+    return (row.unit, row.units) if row else None
+
+
+async def finish_unit(session: AsyncSession, run_key: str, unit: int, result: UnitResult) -> None:
+    await session.execute(
+        update(JobRunUnit)
+        .where(JobRunUnit.run_key == run_key, JobRunUnit.unit == unit)
+        .values(
+            status=DONE,
+            finished_at=func.now(),
+            lease_until=None,
+            advanced=result.advanced,
+            queued=result.queued,
+            last_error=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+async def fail_unit(
+    session: AsyncSession,
+    run_key: str,
+    unit: int,
+    error: Exception,
+    max_attempts: int = UNIT_MAX_ATTEMPTS,
+) -> None:
+    """Put the unit back for another attempt, or mark it failed once attempts run out."""
+    await session.execute(
+        update(JobRunUnit)
+        .where(JobRunUnit.run_key == run_key, JobRunUnit.unit == unit)
+        .values(
+            status=case((JobRunUnit.attempts >= max_attempts, FAILED), else_=PENDING),
+            finished_at=func.now(),
+            lease_until=None,
+            last_error=str(error)[:_ERROR_MAX_LEN],
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+async def run_progress(session: AsyncSession, run_key: str) -> dict[str, int]:
+    """Number of the run's units in each status."""
+    rows = await session.execute(
+        select(JobRunUnit.status, func.count())
+        .where(JobRunUnit.run_key == run_key)
+        .group_by(JobRunUnit.status)
+    )
+    return {status: count for status, count in rows}
+
+
+async def purge_runs(session: AsyncSession, keep_days: int = RUN_KEEP_DAYS) -> int:
+    """Delete finished units older than keep_days and commit."""
+    result = await session.execute(
+        delete(JobRunUnit)
+        .where(
+            JobRunUnit.status.in_((DONE, FAILED)),
+            JobRunUnit.finished_at < func.now() - timedelta(days=keep_days),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount
+
+
+async def work_units(
+    session_factory: async_sessionmaker[AsyncSession],
+    run_key: str,
+    handler: UnitHandler,
+    lease_seconds: float = UNIT_LEASE_SECONDS,
+    max_attempts: int = UNIT_MAX_ATTEMPTS,
+) -> UnitResult:
+    """Claim and process units of the run until none are left; returns the summed results."""
+    total = UnitResult()
+    while True:
+        async with session_factory() as session:
+            part = await claim_unit(session, run_key, lease_seconds, max_attempts)
+        if part is None:
+            return total
+
+        unit, units = part
+        try:
+            result = await handler(part)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.error("Run %s unit %d/%d failed: %s", run_key, unit, units, exc, exc_info=True)
+            async with session_factory() as session:
+                await fail_unit(session, run_key, unit, exc, max_attempts)
+            continue
+
+        async with session_factory() as session:
+            await finish_unit(session, run_key, unit, result)
+        total += result
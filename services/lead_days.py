@@ -0,0 +1,33 @@
+"""
+services/lead_days.py — Reminder lead times stored as bitmasks.
+
+NotificationSettings.lead_days and the per-subscription override
+Subscription.lead_days are bitmasks: bit N set = remind N days before the
+payment. Every lead lies in MIN_LEAD_DAYS..MAX_LEAD_DAYS, so one range scan
+on next_payment covers all of them (notification_service._plan_query).
+
+No dependencies, so the web schemas and the bot handlers can use it
+without importing the planner.
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+MIN_LEAD_DAYS = 1
+MAX_LEAD_DAYS = 14
+LEAD_DAY_CHOICES = (1, 3, 7, 14)
+DEFAULT_LEAD_DAYS = 1 << 1
+
+
+def lead_days_mask(days: Iterable[int]) -> int:
+    """Bitmask for a set of lead times; values outside MIN..MAX_LEAD_DAYS are dropped."""
+    mask = 0
+    for day in days:
+        if MIN_LEAD_DAYS <= day <= MAX_LEAD_DAYS:
+            mask |= 1 << day
+    return mask
+
+
+def lead_days_list(mask: int | None) -> list[int]:
+    """Lead times in a bitmask, ascending."""
+    return [day for day in range(MIN_LEAD_DAYS, MAX_LEAD_DAYS + 1) if mask and mask >> day & 1]
@@ -0,0 +1,159 @@
+"""
+services/leader.py — Leader election over a PostgreSQL advisory lock.
+
+Every bot replica builds the scheduler, but only the replica holding the
+advisory lock runs its jobs. The lock lives on one dedicated connection:
+
+- followers try pg_try_advisory_lock every `renew_interval` seconds
+- the leader renews its lease by pinging that connection at the same pace;
+  if the ping fails it steps down at once (the server has dropped or will
+  drop the connection, and with it the lock)
+- TCP keepalives on the connection let the server notice a dead leader
+  host within seconds, so a follower can take over; they are RESET before
+  the connection goes back to the pool
+
+If the leader process exits, its connection closes and the lock is freed
+immediately.
+
+Usage in bot.py:
+    scheduler.start(paused=True)
+    leader = LeaderElection(db_helper.engine, on_elected=scheduler.resume, on_demoted=scheduler.pause)
+    task = asyncio.create_task(leader.run())
+    ...
+    task.cancel()
+    await leader.release()
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock id for the scheduler; any bigint other code does not use
+SCHEDULER_LOCK_KEY = 0x53554242_4F590001
+
+DEFAULT_RENEW_INTERVAL = 5.0
+
+# Server-side keepalives on the lock connection: a silent leader is dropped after ~5 + 2 * 3 s
+_KEEPALIVE_SETTINGS = (
+    "SET tcp_keepalives_idle = 5",
+    "SET tcp_keepalives_interval = 2",
+    "SET tcp_keepalives_count = 3",
+)
+# The connection is a pooled one: it goes back with the server defaults
+_KEEPALIVE_RESET = (
+    "RESET tcp_keepalives_idle",
+    "RESET tcp_keepalives_interval",
+    "RESET tcp_keepalives_count",
+)
+
+
+class LeaderElection:
+    """Hold `key` as a session-level advisory lock while this process is the leader."""
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        key: int = SCHEDULER_LOCK_KEY,
+        renew_interval: float = DEFAULT_RENEW_INTERVAL,
+        on_elected: Callable[[], None] | None = None,
+        on_demoted: Callable[[], None] | None = None,
+    ) -> None:
+        self.engine = engine
+        self.key = key
+        self.renew_interval = renew_interval
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self._conn: AsyncConnection | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._conn is not None
+
+    async def run(self) -> None:
+        """Campaign and renew until cancelled."""
+        while True:
+            try:
+                if self.is_leader:
+                    await self._renew()
+                else:
+                    await self._try_acquire()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Leader election error: %s", exc)
+                await self._step_down()
+            await asyncio.sleep(self.renew_interval)
+
+    async def _try_acquire(self) -> None:
+        conn = await self.engine.connect()
+        try:
+            # Session-level lock outside any transaction: it lasts as long as the connection
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for statement in _KEEPALIVE_SETTINGS:
+                await conn.execute(text(statement))
+            acquired = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+        except BaseException:
+            await self._close(conn)
+            raise
+        if not acquired:
+            await self._close(conn)
+            return
+        self._conn = conn
+        logger.info("This process is now the scheduler leader.")
+        self._notify(self.on_elected)
+
+    async def _renew(self) -> None:
+        await self._conn.execute(text("SELECT 1"))
+
+    async def _step_down(self) -> None:
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        logger.warning("Lost scheduler leadership.")
+        self._notify(self.on_demoted)
+        try:
+            # The connection is suspect: drop it instead of returning it to the pool
+            await conn.invalidate()
+        except Exception:
+            pass
+
+    async def release(self) -> None:
+        """Give up leadership (on shutdown) so another replica takes over at once."""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._notify(self.on_demoted)
+        try:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+        finally:
+            await self._close(conn)
+
+    @staticmethod
+    async def _close(conn: AsyncConnection) -> None:
+        """Undo the keepalive settings and return the connection to the pool, or drop it if that fails."""
+        try:
+            for statement in _KEEPALIVE_RESET:
+                await conn.execute(text(statement))
+        except Exception:
+            # Settings may still be in place: never hand this connection to anyone else
+            await conn.invalidate()
+        except BaseException:
+            await conn.invalidate()
+            raise
+        finally:
+            await conn.close()
+
+    @staticmethod
+    def _notify(callback: Callable[[], None] | None) -> None:
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception:
+            logger.exception("Leader election callback failed")
@@ -1,35 +1,65 @@
 """
 services/notification_service.py — Handles all scheduled notifications.
 
-Three public async functions intended to be called by the scheduler:
+Public async functions intended to be called by the scheduler:
 
 1. advance_past_due_payments(session)
    - Finds subscriptions where next_payment < today
-   - Advances by 1 month (monthly) or 1 year (yearly) until date is >= today
-   - Called daily so dates are always current
-
-2. check_and_send_notifications(bot, session)
-   - For users with day_before=True: sends a reminder for subscriptions
-     due TOMORROW
-   - After advancing past-due payments the "tomorrow" subscriptions are
-     always fresh
-
-3. send_weekly_digest(bot, session)
-   - For users with weekly=True: sends a digest of payments due in the
-     next 7 days (called on Mondays)
+   - Advances them to the first monthly/yearly payment date >= today in SQL,
+     in bounded chunks
+   - Called on every scheduler run so dates are always current
+
+2. enqueue_planned_notifications(session)
+   - Reads each opted-in user's settings and relevant subscriptions once
+     and plans ONE message combining every kind due today:
+     payment reminders (daily; the day before, or at the user's own lead
+     times, see services/lead_days.py), weekly digest (Mondays) and monthly
+     report (1st of the month)
+   - Writes it to the notification outbox; services/outbox.py sends it
+   - With local=True, `today` is the users' local date: only users for
+     whom it is that date in NotificationSettings.timezone, and whose
+     notify_hour has come, are included (the scheduler runs every few
+     minutes over every date in effect, see local_dates)
+   - Records what it queued in the notification ledger and skips what is
+     already there, so reruns are idempotent and a missed run is made up
+     by the next one (digest / report: up to CATCH_UP_DAYS late)
 """
 from __future__ import annotations
 
 import logging
-from datetime import date, timedelta
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field, replace
+from collections.abc import Collection
+from datetime import date, datetime, time, timedelta, timezone
 from decimal import Decimal
-
-from aiogram import Bot
-from dateutil.relativedelta import relativedelta
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from database.models import NotificationSettings, Subscription, User
+from itertools import groupby
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import (
+    Date,
+    DateTime,
+    Integer,
+    and_,
+    case,
+    cast,
+    delete,
+    exists,
+    extract,
+    func,
+    literal,
+    or_,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncResult, AsyncSession
+
+from database.models import NotificationLedger, NotificationSettings, Subscription, User
+from services.lead_days import MAX_LEAD_DAYS, MIN_LEAD_DAYS
+from services.outbox import enqueue_messages
+from services.user_service import reachable
 
 logger = logging.getLogger(__name__)
 
@@ -51,199 +81,682 @@ def fmt_price(price: Decimal) -> str:
     return f"{s}.{frac:02d}"
 
 
-def _advance_date(current: date, period: str) -> date:
-    """Advance a date by one period (month or year)."""
-    if period == "monthly":
-        return current + relativedelta(months=1)
-    elif period == "yearly":
-        return current + relativedelta(years=1)
-    else:
-        # Fallback: treat unknown period as monthly
-        return current + relativedelta(months=1)
+# ──────────────────────────────────────────────────────────────────────────────
+# Streaming helpers
+# ──────────────────────────────────────────────────────────────────────────────
+
+# Rows per server-side cursor fetch
+STREAM_BATCH_SIZE = 1000
+
+
+class StreamStats:
+    """Counters for a streamed scan: rows fetched and the largest per-user batch."""
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.users = 0
+        self.peak_batch = 0
+
+
+async def streamable(session: AsyncSession) -> bool:
+    """
+    Whether `session` can stream: a server-side cursor needs a transaction.
+    A fresh AUTOCOMMIT read session is switched to READ COMMITTED; one that
+    has already run a query cannot be, and the caller has to buffer.
+    """
+    if session.in_transaction():
+        connection = await session.connection()
+        return connection.sync_connection.get_execution_options().get("isolation_level") != "AUTOCOMMIT"
+    if session.get_bind().get_execution_options().get("isolation_level") == "AUTOCOMMIT":
+        await session.connection(execution_options={"isolation_level": "READ COMMITTED"})
+    return True
+
+
+async def stream_in_transaction(session: AsyncSession, stmt) -> AsyncResult:
+    """session.stream(stmt) that also works on fresh read-only sessions (see streamable)."""
+    await streamable(session)
+    return await session.stream(stmt)
+
+
+async def _group_rows_by_user(
+    result: AsyncResult,
+    stats: StreamStats | None = None,
+) -> AsyncIterator[tuple[int, list[Row]]]:
+    """
+    Group a streamed result ordered by user_id into (user_id, rows) batches.
+    Only the current user's rows are held in memory.
+    """
+    stats = stats or StreamStats()
+    current_user: int | None = None
+    batch: list[Row] = []
+    async for row in result:
+        stats.rows += 1
+        if row.user_id != current_user:
+            if batch:
+                stats.users += 1
+                stats.peak_batch = max(stats.peak_batch, len(batch))
+                yield current_user, batch
+            current_user, batch = row.user_id, []
+        batch.append(row)
+    if batch:
+        stats.users += 1
+        stats.peak_batch = max(stats.peak_batch, len(batch))
+        yield current_user, batch
+
+
+def in_part(user_id, part: tuple[int, int] | None):
+    """
+    SQL condition: the user belongs to work unit part = (unit, units), i.e.
+    user_id % units == unit. Always true when part is None (whole shard).
+    """
+    if part is None:
+        return true()
+    unit, units = part
+    return user_id % units == unit
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Local delivery time
+# ──────────────────────────────────────────────────────────────────────────────
+
+# Defaults match the old fixed schedule: 12:00 Moscow == 09:00 UTC
+DEFAULT_TIMEZONE = "Europe/Moscow"
+DEFAULT_NOTIFY_HOUR = 12
+
+# Users sharing a delivery hour are spread over its first N minutes by user_id,
+# so they land in different scheduler ticks. Must leave a tick before midnight.
+DELIVERY_SPREAD_MINUTES = 45
+
+
+def local_dates(now: datetime | None = None) -> list[date]:
+    """Calendar dates in effect somewhere (UTC-12 … UTC+14) at `now`."""
+    now = now or datetime.now(timezone.utc)
+    first = (now - timedelta(hours=12)).date()
+    last = (now + timedelta(hours=14)).date()
+    return [first + timedelta(days=n) for n in range((last - first).days + 1)]
+
+
+def _local_now(tz_name):
+    return func.timezone(func.coalesce(tz_name, DEFAULT_TIMEZONE), func.now())
+
+
+def _on_local_date(today: date):
+    """SQL condition on Subscription: it is `today` in the owner's timezone."""
+    users = (
+        select(User.id)
+        .outerjoin(NotificationSettings, NotificationSettings.user_id == User.id)
+        .where(cast(_local_now(NotificationSettings.timezone), Date) == today)
+    )
+    return Subscription.user_id.in_(users)
+
+
+def _send_time_reached(today: date, since: datetime | None = None):
+    """
+    SQL condition on NotificationSettings: it is `today` in the user's
+    timezone and their send time (notify_hour plus a per-user offset) has
+    passed; with `since`, also that it came after that instant.
+    """
+    tz = func.coalesce(NotificationSettings.timezone, DEFAULT_TIMEZONE)
+    local_now = _local_now(NotificationSettings.timezone)
+    minute_of_day = extract("hour", local_now) * 60 + extract("minute", local_now)
+    offset = NotificationSettings.user_id % DELIVERY_SPREAD_MINUTES
+    send_minute = NotificationSettings.notify_hour * 60 + offset
+    condition = and_(cast(local_now, Date) == today, minute_of_day >= send_minute)
+    if since is not None:
+        local_since = func.timezone(tz, literal(since, DateTime(timezone=True)))
+        since_minute = extract("hour", local_since) * 60 + extract("minute", local_since)
+        # `since` on an earlier local date: the whole of today is new
+        condition = and_(condition, or_(cast(local_since, Date) < today, since_minute < send_minute))
+    return condition
+
+
+def user_zone(tz_name: str | None) -> ZoneInfo:
+    """NotificationSettings.timezone as a ZoneInfo; unknown or empty names fall back to the default."""
+    try:
+        return ZoneInfo(tz_name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def send_time(user_id: int, tz_name: str | None, notify_hour: int | None, day: date) -> datetime:
+    """The user's send time on their local `day`, in UTC (when _send_time_reached starts matching)."""
+    tz = user_zone(tz_name)
+    hour = DEFAULT_NOTIFY_HOUR if notify_hour is None else notify_hour
+    local = datetime.combine(day, time(hour), tz) + timedelta(minutes=user_id % DELIVERY_SPREAD_MINUTES)
+    return local.astimezone(timezone.utc)
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 1. Advance past-due payments
 # ──────────────────────────────────────────────────────────────────────────────
 
-async def advance_past_due_payments(session: AsyncSession) -> int:
+ADVANCE_CHUNK_SIZE = 5000
+
+
+def _occurrence_on(months):
+    """
+    SQL: the payment `months` after next_payment's month, on the anchor day
+    clamped to that month's length (occurrences.occurrence).
+    """
+    anchor = func.coalesce(Subscription.anchor_day, cast(extract("day", Subscription.next_payment), Integer))
+    month_start = func.date_trunc("month", Subscription.next_payment) + func.make_interval(0, months)
+    month_end = month_start + func.make_interval(0, 1) - func.make_interval(0, 0, 0, 1)
+    month_days = cast(extract("day", month_end), Integer)
+    return cast(month_start + func.make_interval(0, 0, 0, func.least(anchor, month_days) - 1), Date)
+
+
+def _advanced_next_payment(today: date):
     """
-    Find all subscriptions where next_payment < today and advance them
-    forward period-by-period until next_payment >= today.
+    SQL expression for the first payment date >= today, computed in one step
+    (occurrences.next_occurrence).
+
+    The number of periods to skip is the month (or year) distance from
+    next_payment to today; if that lands before today in the same month
+    (year), one more period is added. The day comes from the stored
+    anchor_day, not from the previous, possibly clamped date
+    (Jan 31 -> Feb 28 -> Mar 31, not Mar 28).
+    """
+    np_ = Subscription.next_payment
+    np_year = cast(extract("year", np_), Integer)
+    np_month = cast(extract("month", np_), Integer)
+
+    months_behind = (today.year * 12 + today.month) - (np_year * 12 + np_month)
+    monthly = _occurrence_on(months_behind)
+    monthly = case((monthly < today, _occurrence_on(months_behind + 1)), else_=monthly)
+
+    years_behind = today.year - np_year
+    yearly = _occurrence_on(years_behind * 12)
+    yearly = case((yearly < today, _occurrence_on(years_behind * 12 + 12)), else_=yearly)
+
+    # Unknown periods are treated as monthly
+    return case((Subscription.period == "yearly", yearly), else_=monthly)
+
+
+async def advance_past_due_payments(
+    session: AsyncSession,
+    chunk_size: int = ADVANCE_CHUNK_SIZE,
+    today: date | None = None,
+    part: tuple[int, int] | None = None,
+    local: bool = False,
+    user_ids: Collection[int] | None = None,
+) -> int:
+    """
+    Move every subscription with next_payment < today to its first payment
+    date >= today with set-based UPDATEs, chunk_size rows per transaction.
+    No ORM objects are loaded. With `part`, only that work unit's users
+    are touched (see in_part); with `local`, only users for whom it is
+    `today` in their own timezone; with `user_ids`, only those users.
 
     Returns the count of subscriptions that were updated.
     """
-    today = date.today()
-    result = await session.execute(
-        select(Subscription).where(Subscription.next_payment < today)
+    today = today or date.today()
+    conditions = [Subscription.next_payment < today, in_part(Subscription.user_id, part)]
+    if local:
+        conditions.append(_on_local_date(today))
+    if user_ids is not None:
+        conditions.append(Subscription.user_id.in_(user_ids))
+    chunk_ids = (
+        select(Subscription.id)
+        .where(*conditions)
+        .order_by(Subscription.id)
+        .limit(chunk_size)
+        .with_for_update(skip_locked=True)
     )
-    subs = list(result.scalars().all())
-
-    updated = 0
-    for sub in subs:
-        while sub.next_payment < today:
-            sub.next_payment = _advance_date(sub.next_payment, sub.period)
-        updated += 1
-        logger.info(
-            "Advanced subscription id=%s (%s) next_payment to %s",
-            sub.id, sub.name, sub.next_payment,
+    stmt = (
+        update(Subscription)
+        .where(Subscription.id.in_(chunk_ids))
+        .values(
+            next_payment=_advanced_next_payment(today),
+            # Rows from before anchor_day keep the day they had until now
+            anchor_day=func.coalesce(
+                Subscription.anchor_day, cast(extract("day", Subscription.next_payment), Integer)
+            ),
         )
+        .execution_options(synchronize_session=False)
+    )
 
-    if updated:
+    updated = 0
+    chunks = 0
+    while True:
+        result = await session.execute(stmt)
         await session.commit()
+        # Advanced rows no longer match next_payment < today, so the next chunk picks up new ones
+        updated += result.rowcount
+        chunks += 1
+        if result.rowcount < chunk_size:
+            break
 
+    logger.info("Advanced %d subscription(s) in %d chunk(s).", updated, chunks)
     return updated
 
 
 # ──────────────────────────────────────────────────────────────────────────────
-# 2. Daily "day before" notifications
+# 2. Notification planner — one pass per user for every kind due today
 # ──────────────────────────────────────────────────────────────────────────────
 
-async def check_and_send_notifications(bot: Bot, session: AsyncSession) -> None:
-    """
-    Send "⏰ Завтра списание" to users who have:
-    - day_before=True in NotificationSettings
-    - At least one subscription with next_payment == tomorrow
-    """
-    tomorrow = date.today() + timedelta(days=1)
+# Notification kinds; the names match the NotificationSettings flags
+DAY_BEFORE = "day_before"
+WEEKLY = "weekly"
+MONTHLY = "monthly"
 
-    # Get all users with day_before enabled
-    result = await session.execute(
-        select(NotificationSettings).where(NotificationSettings.day_before.is_(True))
-    )
-    settings_list = list(result.scalars().all())
+MONTHLY_REPORT_TOP = 5
 
-    for ns in settings_list:
-        user_id = ns.user_id
+def _days_until(payment, today: date):
+    """SQL: days from today to the payment date (date - date is an integer in Postgres)."""
+    return payment - today
 
-        # Find subscriptions due tomorrow for this user
-        sub_result = await session.execute(
-            select(Subscription).where(
-                Subscription.user_id == user_id,
-                Subscription.next_payment == tomorrow,
-            )
-        )
-        due_subs = list(sub_result.scalars().all())
 
-        if not due_subs:
-            continue
+def _has_lead(mask, lead):
+    """SQL condition: bit `lead` is set in `mask`."""
+    return mask.op("&")(literal(1).op("<<")(lead)) != 0
 
-        lines: list[str] = ["⏰ <b>Завтра списание:</b>\n"]
-        total = Decimal("0")
-        for sub in due_subs:
-            lines.append(f"🔹 {sub.name} — {fmt_price(sub.price)} ₽")
-            total += sub.price
 
-        if len(due_subs) > 1:
-            lines.append(f"\n💰 Итого завтра: {fmt_price(total.quantize(Decimal('0.01')))} ₽")
+def reminder_period(payment: date, lead: int) -> str:
+    """
+    Ledger period of a reminder: the payment date, plus the lead when it is
+    not the day before (so day-before keys stay as they always were).
+    """
+    if lead == 1:
+        return payment.isoformat()
+    return f"{payment.isoformat()}-{lead}d"
 
-        text = "\n".join(lines)
 
-        try:
-            await bot.send_message(user_id, text, parse_mode="HTML")
-            logger.info("Sent day_before notification to user %s", user_id)
-        except Exception as exc:
-            logger.warning("Failed to send notification to user %s: %s", user_id, exc)
+# A missed run is made up by later runs this many days into the week / month;
+# the ledger keeps those runs from repeating what was already sent
+CATCH_UP_DAYS = 2
 
+# Ledger rows older than this are deleted by the purge job
+LEDGER_KEEP_DAYS = 90
 
-# ──────────────────────────────────────────────────────────────────────────────
-# 3. Weekly digest (Mondays)
-# ──────────────────────────────────────────────────────────────────────────────
 
-async def send_weekly_digest(bot: Bot, session: AsyncSession) -> None:
+def kinds_due(today: date) -> set[str]:
     """
-    Send a digest of payments due in the next 7 days to users with weekly=True.
-    Intended to run every Monday.
+    Kinds a run covers: reminders daily, the digest and the report up to
+    CATCH_UP_DAYS after Monday / the 1st. Users who turn them on in that
+    window get the current week's / month's one.
     """
-    today = date.today()
-    week_end = today + timedelta(days=7)
-
-    result = await session.execute(
-        select(NotificationSettings).where(NotificationSettings.weekly.is_(True))
+    kinds = {DAY_BEFORE}
+    if today.weekday() <= CATCH_UP_DAYS:
+        kinds.add(WEEKLY)
+    if today.day <= 1 + CATCH_UP_DAYS:
+        kinds.add(MONTHLY)
+    return kinds
+
+
+def period_key(kind: str, today: date) -> str:
+    """Ledger period of a kind: the payment date, the ISO week or the month."""
+    if kind == DAY_BEFORE:
+        return (today + timedelta(days=1)).isoformat()
+    if kind == WEEKLY:
+        year, week, _ = today.isocalendar()
+        return f"{year}-W{week:02d}"
+    return f"{today:%Y-%m}"
+
+
+def _not_sent(kind: str, period: str, user_id, subscription_id=0):
+    """SQL condition: the ledger has no entry for this user / kind / period / subscription."""
+    return ~exists().where(
+        NotificationLedger.user_id == user_id,
+        NotificationLedger.kind == kind,
+        NotificationLedger.period_key == period,
+        NotificationLedger.subscription_id == subscription_id,
     )
-    settings_list = list(result.scalars().all())
 
-    for ns in settings_list:
-        user_id = ns.user_id
 
-        sub_result = await session.execute(
-            select(Subscription).where(
-                Subscription.user_id == user_id,
-                Subscription.next_payment >= today,
-                Subscription.next_payment <= week_end,
-            ).order_by(Subscription.next_payment)
+@dataclass
+class DeliveryPlan:
+    """Everything one user should receive in a run, rendered as one message."""
+    user_id: int
+    day_before: list[Row] = field(default_factory=list)
+    weekly: list[Row] = field(default_factory=list)
+    monthly_top: list[Row] = field(default_factory=list)
+    subs_count: int = 0
+    total_monthly: Decimal = Decimal("0")
+
+    @property
+    def empty(self) -> bool:
+        return not (self.day_before or self.weekly or self.monthly_top)
+
+    @property
+    def kinds(self) -> list[str]:
+        """Kinds present in this plan, in message order."""
+        sections = ((DAY_BEFORE, self.day_before), (WEEKLY, self.weekly), (MONTHLY, self.monthly_top))
+        return [kind for kind, rows in sections if rows]
+
+
+def _plan_query(
+    today: date,
+    kinds: set[str],
+    part: tuple[int, int] | None = None,
+    local: bool = False,
+    user_ids: Collection[int] | None = None,
+    since: datetime | None = None,
+):
+    """
+    One query over notification_settings JOIN subscriptions: per user, the
+    rows for every requested kind not in the ledger yet, ordered by user_id.
+    `local` / `since` keep users whose send time has come (_send_time_reached),
+    `user_ids` only those users; unreachable users are always left out.
+
+    Reminders are one range scan on next_payment over MIN..MAX_LEAD_DAYS,
+    filtered by each row's lead. Monthly totals and the price ranking are
+    window functions, added only when MONTHLY is requested.
+    """
+    week_end = today + timedelta(days=7)
+
+    columns = [
+        Subscription.id,
+        Subscription.user_id,
+        Subscription.name,
+        Subscription.price,
+        Subscription.next_payment,
+        Subscription.is_active,
+        _days_until(Subscription.next_payment, today).label("lead"),
+        func.coalesce(Subscription.lead_days, NotificationSettings.lead_days).label("lead_days"),
+        NotificationSettings.day_before,
+        NotificationSettings.weekly,
+        NotificationSettings.monthly,
+    ]
+    if MONTHLY in kinds:
+        monthly_price = case(
+            (Subscription.period == "monthly", Subscription.price),
+            else_=Subscription.price / 12,
         )
-        due_subs = list(sub_result.scalars().all())
+        columns += [
+            func.count().over(partition_by=Subscription.user_id).label("subs_count"),
+            func.sum(monthly_price).over(partition_by=Subscription.user_id).label("total_monthly"),
+            func.row_number().over(
+                partition_by=Subscription.user_id,
+                order_by=(Subscription.price.desc(), Subscription.id),
+            ).label("price_rank"),
+        ]
 
-        if not due_subs:
-            continue
+    base = (
+        select(*columns)
+        .join(NotificationSettings, NotificationSettings.user_id == Subscription.user_id)
+        .where(
+            or_(*(getattr(NotificationSettings, kind).is_(True) for kind in kinds)),
+            in_part(Subscription.user_id, part),
+            _send_time_reached(today, since) if local else true(),
+            Subscription.user_id.in_(user_ids) if user_ids is not None else true(),
+            reachable(Subscription.user_id),
+        )
+        .subquery()
+    )
 
-        lines: list[str] = ["📬 <b>Платежи на этой неделе:</b>\n"]
-        total = Decimal("0")
+    # Each kind keeps only what the ledger has not recorded yet, so a rerun costs only the delta.
+    # The per-kind match is returned as a want_<kind> column for plan_notifications.
+    wanted = {}
+    if DAY_BEFORE in kinds:
+        reminder_periods = case(
+            {
+                lead: reminder_period(today + timedelta(days=lead), lead)
+                for lead in range(MIN_LEAD_DAYS, MAX_LEAD_DAYS + 1)
+            },
+            value=base.c.lead,
+        )
+        wanted[DAY_BEFORE] = and_(
+            base.c.day_before.is_(True),
+            # Paused subscriptions are not charged, so there is nothing to remind about
+            base.c.is_active.is_(True),
+            base.c.next_payment.between(
+                today + timedelta(days=MIN_LEAD_DAYS), today + timedelta(days=MAX_LEAD_DAYS)
+            ),
+            _has_lead(base.c.lead_days, base.c.lead),
+            _not_sent(DAY_BEFORE, reminder_periods, base.c.user_id, base.c.id),
+        )
+    if WEEKLY in kinds:
+        wanted[WEEKLY] = and_(
+            base.c.weekly.is_(True),
+            base.c.next_payment.between(today, week_end),
+            _not_sent(WEEKLY, period_key(WEEKLY, today), base.c.user_id),
+        )
+    if MONTHLY in kinds:
+        wanted[MONTHLY] = and_(
+            base.c.monthly.is_(True),
+            base.c.price_rank <= MONTHLY_REPORT_TOP,
+            _not_sent(MONTHLY, period_key(MONTHLY, today), base.c.user_id),
+        )
 
-        for sub in due_subs:
-            day_name = RU_DAYS_SHORT[sub.next_payment.weekday()]
-            day_num = sub.next_payment.day
-            month_name = RU_MONTHS_GEN[sub.next_payment.month]
-            lines.append(
-                f"🔹 {day_name}, {day_num} {month_name} — {sub.name} — {fmt_price(sub.price)} ₽"
+    flags = [condition.label(f"want_{kind}") for kind, condition in wanted.items()]
+    return select(base, *flags).where(or_(*wanted.values())).order_by(base.c.user_id, base.c.id)
+
+
+async def plan_notifications(
+    session: AsyncSession,
+    today: date,
+    kinds: set[str],
+    stats: StreamStats | None = None,
+    part: tuple[int, int] | None = None,
+    local: bool = False,
+    user_ids: Collection[int] | None = None,
+    since: datetime | None = None,
+) -> AsyncIterator[DeliveryPlan]:
+    """Stream one DeliveryPlan per user (of work unit `part`, if given) that has something to receive."""
+    query = _plan_query(today, kinds, part, local, user_ids, since)
+    result = await stream_in_transaction(session, query.execution_options(yield_per=STREAM_BATCH_SIZE))
+
+    async for user_id, rows in _group_rows_by_user(result, stats):
+        plan = DeliveryPlan(user_id=user_id)
+        for row in rows:
+            if DAY_BEFORE in kinds and row.want_day_before:
+                plan.day_before.append(row)
+            if WEEKLY in kinds and row.want_weekly:
+                plan.weekly.append(row)
+            if MONTHLY in kinds and row.want_monthly:
+                plan.monthly_top.append(row)
+                plan.subs_count = row.subs_count
+                plan.total_monthly = Decimal(str(row.total_monthly))
+        plan.weekly.sort(key=lambda r: (r.next_payment, r.id))
+        plan.monthly_top.sort(key=lambda r: r.price_rank)
+        if not plan.empty:
+            yield plan
+
+
+def ledger_entries(plan: DeliveryPlan, today: date) -> list[dict]:
+    """Ledger rows recording that `plan` has been delivered."""
+    entries = [
+        {
+            "user_id": plan.user_id,
+            "kind": DAY_BEFORE,
+            "period_key": reminder_period(row.next_payment, row.lead),
+            "subscription_id": row.id,
+        }
+        for row in plan.day_before
+    ]
+    for kind in plan.kinds:
+        if kind != DAY_BEFORE:
+            entries.append(
+                {
+                    "user_id": plan.user_id,
+                    "kind": kind,
+                    "period_key": period_key(kind, today),
+                    "subscription_id": 0,
+                }
             )
-            total += sub.price
-
-        lines.append(f"\n💰 Итого: ~{fmt_price(total.quantize(Decimal('0.01')))} ₽")
+    return entries
 
-        text = "\n".join(lines)
 
-        try:
-            await bot.send_message(user_id, text, parse_mode="HTML")
-            logger.info("Sent weekly digest to user %s", user_id)
-        except Exception as exc:
-            logger.warning("Failed to send weekly digest to user %s: %s", user_id, exc)
+def _ledger_key(entry: dict) -> tuple:
+    return entry["user_id"], entry["kind"], entry["period_key"], entry["subscription_id"]
 
 
-# ──────────────────────────────────────────────────────────────────────────────
-# 4. Monthly report
-# ──────────────────────────────────────────────────────────────────────────────
-
-async def send_monthly_report(bot: Bot, session: AsyncSession) -> None:
+async def claim_ledger(session: AsyncSession, entries: list[dict]) -> set[tuple]:
     """
-    Send a monthly expense summary to users with monthly=True.
-    Intended to run on the 1st of every month.
+    Add entries to the ledger (does not commit); returns the keys of those
+    this transaction added. Entries a concurrent run holds wait for it and
+    are not returned. Sorted, so every run locks in the same order.
     """
+    if not entries:
+        return set()
+    stmt = (
+        pg_insert(NotificationLedger)
+        .on_conflict_do_nothing()
+        .returning(
+            NotificationLedger.user_id,
+            NotificationLedger.kind,
+            NotificationLedger.period_key,
+            NotificationLedger.subscription_id,
+        )
+    )
+    result = await session.execute(stmt, sorted(entries, key=_ledger_key))
+    return {tuple(row) for row in result.all()}
+
+
+def claimed_plan(plan: DeliveryPlan, claimed: set[tuple], today: date) -> DeliveryPlan | None:
+    """The part of `plan` whose ledger entries are in `claimed` (see claim_ledger); None if nothing is."""
+    def has(kind: str, period: str, subscription_id: int = 0) -> bool:
+        return (plan.user_id, kind, period, subscription_id) in claimed
+
+    part = replace(
+        plan,
+        day_before=[
+            row for row in plan.day_before
+            if has(DAY_BEFORE, reminder_period(row.next_payment, row.lead), row.id)
+        ],
+        weekly=plan.weekly if has(WEEKLY, period_key(WEEKLY, today)) else [],
+        monthly_top=plan.monthly_top if has(MONTHLY, period_key(MONTHLY, today)) else [],
+    )
+    return None if part.empty else part
+
+
+async def purge_ledger(session: AsyncSession, keep_days: int = LEDGER_KEEP_DAYS) -> int:
+    """Delete ledger rows older than keep_days; they no longer match any period a run can plan."""
     result = await session.execute(
-        select(NotificationSettings).where(NotificationSettings.monthly.is_(True))
+        delete(NotificationLedger)
+        .where(NotificationLedger.created_at < func.now() - timedelta(days=keep_days))
+        .execution_options(synchronize_session=False)
     )
-    settings_list = list(result.scalars().all())
+    await session.commit()
+    return result.rowcount
 
-    for ns in settings_list:
-        user_id = ns.user_id
 
-        sub_result = await session.execute(
-            select(Subscription).where(Subscription.user_id == user_id)
-        )
-        all_subs = list(sub_result.scalars().all())
+# ──────────────────────────────────────────────────────────────────────────────
+# 3. Rendering
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _days_word(n: int) -> str:
+    if n % 10 == 1 and n % 100 != 11:
+        return "день"
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return "дня"
+    return "дней"
+
+
+def _render_day_before(due_subs: list[Row]) -> str:
+    """One block per lead time, nearest payment first."""
+    blocks = []
+    for lead, group in groupby(sorted(due_subs, key=lambda r: (r.lead, r.id)), key=lambda r: r.lead):
+        subs = list(group)
+        if lead == 1:
+            lines = ["⏰ <b>Завтра списание:</b>\n"]
+        else:
+            lines = [f"⏰ <b>Через {lead} {_days_word(lead)} списание:</b>\n"]
+        total = Decimal("0")
+        for sub in subs:
+            lines.append(f"🔹 {sub.name} — {fmt_price(sub.price)} ₽")
+            total += sub.price
+
+        if len(subs) > 1:
+            label = "Итого завтра" if lead == 1 else "Итого"
+            lines.append(f"\n💰 {label}: {fmt_price(total.quantize(Decimal('0.01')))} ₽")
+        blocks.append("\n".join(lines))
 
-        if not all_subs:
-            continue
+    return "\n\n".join(blocks)
 
-        total_monthly = sum(
-            (s.price if s.period == "monthly" else s.price / 12)
-            for s in all_subs
+
+def _render_weekly(due_subs: list[Row]) -> str:
+    lines: list[str] = ["📬 <b>Платежи на этой неделе:</b>\n"]
+    total = Decimal("0")
+
+    for sub in due_subs:
+        day_name = RU_DAYS_SHORT[sub.next_payment.weekday()]
+        day_num = sub.next_payment.day
+        month_name = RU_MONTHS_GEN[sub.next_payment.month]
+        lines.append(
+            f"🔹 {day_name}, {day_num} {month_name} — {sub.name} — {fmt_price(sub.price)} ₽"
         )
+        total += sub.price
 
-        lines = [
-            "📊 <b>Ежемесячный отчёт</b>\n",
-            f"Всего подписок: {len(all_subs)}",
-            f"💰 Ежемесячные расходы: ~{fmt_price(Decimal(str(total_monthly)).quantize(Decimal('0.01')))} ₽",
-            "\nСамые дорогие:",
-        ]
-        for sub in sorted(all_subs, key=lambda s: s.price, reverse=True)[:5]:
-            lines.append(f"🔹 {sub.name} — {fmt_price(sub.price)} ₽")
+    lines.append(f"\n💰 Итого: ~{fmt_price(total.quantize(Decimal('0.01')))} ₽")
+
+    return "\n".join(lines)
+
+
+def _render_monthly(plan: DeliveryPlan) -> str:
+    lines = [
+        "📊 <b>Ежемесячный отчёт</b>\n",
+        f"Всего подписок: {plan.subs_count}",
+        f"💰 Ежемесячные расходы: ~{fmt_price(plan.total_monthly.quantize(Decimal('0.01')))} ₽",
+        "\nСамые дорогие:",
+    ]
+    for sub in plan.monthly_top:
+        lines.append(f"🔹 {sub.name} — {fmt_price(sub.price)} ₽")
+
+    return "\n".join(lines)
+
+
+def render_plan(plan: DeliveryPlan) -> str:
+    """Combine every section of the plan into a single message."""
+    sections = []
+    if plan.day_before:
+        sections.append(_render_day_before(plan.day_before))
+    if plan.weekly:
+        sections.append(_render_weekly(plan.weekly))
+    if plan.monthly_top:
+        sections.append(_render_monthly(plan))
+    return "\n\n".join(sections)
 
-        text = "\n".join(lines)
 
-        try:
-            await bot.send_message(user_id, text, parse_mode="HTML")
-            logger.info("Sent monthly report to user %s", user_id)
-        except Exception as exc:
-            logger.warning("Failed to send monthly report to user %s: %s", user_id, exc)
+# ──────────────────────────────────────────────────────────────────────────────
+# 4. Queueing
+# ──────────────────────────────────────────────────────────────────────────────
+
+async def enqueue_planned_notifications(
+    session: AsyncSession,
+    kinds: set[str] | None = None,
+    today: date | None = None,
+    part: tuple[int, int] | None = None,
+    local: bool = False,
+    user_ids: Collection[int] | None = None,
+    since: datetime | None = None,
+) -> int:
+    """
+    Plan the messages and store them in the notification outbox, committed
+    with their ledger rows in one transaction. Only the parts whose ledger
+    rows this run claims are queued (claim_ledger), so a concurrent run for
+    the same user queues nothing twice. `local`, `since` and `user_ids`
+    narrow the users as in _plan_query. Returns the number of queued messages.
+    """
+    today = today or date.today()
+    kinds = kinds or kinds_due(today)
+
+    stats = StreamStats()
+    queued = 0
+    plans: list[DeliveryPlan] = []
+    async for plan in plan_notifications(session, today, kinds, stats, part, local, user_ids, since):
+        plans.append(plan)
+        if len(plans) >= STREAM_BATCH_SIZE:
+            queued += await _enqueue_claimed(session, plans, today)
+            plans = []
+    queued += await _enqueue_claimed(session, plans, today)
+    await session.commit()
+
+    logger.info(
+        "Notifications (%s): fetched %d row(s) for %d user(s), peak batch %d row(s), enqueued %d.",
+        "+".join(sorted(kinds)), stats.rows, stats.users, stats.peak_batch, queued,
+    )
+    return queued
+
+
+async def _enqueue_claimed(session: AsyncSession, plans: list[DeliveryPlan], today: date) -> int:
+    """Claim the plans' ledger entries, then queue what this run claimed."""
+    claimed = await claim_ledger(session, [entry for plan in plans for entry in ledger_entries(plan, today)])
+    messages = []
+    for plan in plans:
+        part = claimed_plan(plan, claimed, today)
+        if part is not None:
+            messages.append(
+                {"user_id": part.user_id, "kind": "+".join(part.kinds), "body": render_plan(part)}
+            )
+    return await enqueue_messages(session, messages)
@@ -0,0 +1,88 @@
+"""
+services/occurrences.py — Payment dates of a subscription, computed directly.
+
+A subscription pays every `period` (PERIOD_MONTHS) on its anchor day of
+the month, clamped to the month's length: anchor 31 gives Jan 31, Feb 28,
+Mar 31, ... The anchor is stored (Subscription.anchor_day), so a clamped
+date never becomes the new day of the month (the drift of adding a month
+to the previous date: Jan 31 -> Feb 28 -> Mar 28 forever).
+
+Occurrence n of a series is a month index plus n * step, so every lookup
+is O(1) arithmetic, however many periods lie in between:
+
+- occurrence(origin, anchor_day, period, n) — the nth date after origin
+- next_occurrence(..., on_or_after)         — the first date >= a given day
+- occurrences_between(..., first, last)     — every date in [first, last]
+
+`origin` is any payment date of the series, usually next_payment.
+notification_service._advanced_next_payment computes next_occurrence in SQL.
+
+Usage:
+    due = next_occurrence(sub.next_payment, anchor_day(sub), sub.period, today)
+"""
+from __future__ import annotations
+
+import calendar
+from datetime import date
+from typing import Protocol
+
+# Months between payments; unknown periods are treated as monthly
+PERIOD_MONTHS = {"monthly": 1, "yearly": 12}
+
+
+class _Payable(Protocol):
+    next_payment: date
+    period: str
+    anchor_day: int | None
+
+
+def period_months(period: str | None) -> int:
+    return PERIOD_MONTHS.get(period or "", 1)
+
+
+def anchor_day(sub: _Payable) -> int:
+    """The subscription's day of the month; rows without a stored anchor use next_payment's day."""
+    return sub.anchor_day or sub.next_payment.day
+
+
+def _month_index(day: date) -> int:
+    return day.year * 12 + day.month - 1
+
+
+def _on_day(month_index: int, anchor: int) -> date:
+    year, month = divmod(month_index, 12)
+    month += 1
+    return date(year, month, min(anchor, calendar.monthrange(year, month)[1]))
+
+
+def occurrence(origin: date, anchor: int, period: str | None, n: int) -> date:
+    """Payment date n periods after origin (n may be negative)."""
+    return _on_day(_month_index(origin) + n * period_months(period), anchor)
+
+
+def next_occurrence(origin: date, anchor: int, period: str | None, on_or_after: date) -> date:
+    """First payment date >= on_or_after; origin itself if it is not earlier."""
+    if origin >= on_or_after:
+        return origin
+    step = period_months(period)
+    # Periods until the target month is reached, then one more if the day is still behind
+    n = -(-(_month_index(on_or_after) - _month_index(origin)) // step)
+    due = occurrence(origin, anchor, period, n)
+    return due if due >= on_or_after else occurrence(origin, anchor, period, n + 1)
+
+
+def occurrences_between(origin: date, anchor: int, period: str | None, first: date, last: date) -> list[date]:
+    """Payment dates from first to last inclusive, from origin onwards."""
+    dates = []
+    due = next_occurrence(origin, anchor, period, first)
+    n = (_month_index(due) - _month_index(origin)) // period_months(period)
+    while due <= last:
+        dates.append(due)
+        n += 1
+        due = occurrence(origin, anchor, period, n)
+    return dates
+
+
+def sub_occurrences_between(sub: _Payable, first: date, last: date) -> list[date]:
+    """occurrences_between for a Subscription."""
+    return occurrences_between(sub.next_payment, anchor_day(sub), sub.period, first, last)
@@ -0,0 +1,314 @@
+"""
+services/outbox.py — Persistent notification outbox and the workers draining it.
+
+Planning and sending are decoupled through the `notification_outbox` table:
+
+- enqueue_messages(session, messages) — bulk-insert rendered messages
+  (called by notification_service.enqueue_planned_notifications)
+- OutboxWorker — claims a batch of due rows with FOR UPDATE SKIP LOCKED,
+  sends them through a NotificationSender and records the outcome
+- purge_outbox(session) — delete finished rows past their retention
+
+Claiming does not hold a transaction open while sending. It bumps
+`attempts` and pushes `available_at` forward by a lease; if the worker dies,
+the rows become due again once the lease runs out. Any number of workers,
+in any number of processes, can drain the same table.
+
+Final statuses: 'sent', or 'failed' after a permanent Telegram error
+(blocked bot, bad chat) or OUTBOX_MAX_ATTEMPTS transient ones. Transient
+failures go back to 'pending' with exponential backoff. A user found
+unreachable is marked on User (user_service.mark_unreachable), which keeps
+them out of later planning, and their other pending messages are failed
+without sending.
+
+Usage in bot.py:
+    tasks = start_outbox_workers(bot, session_factories, bucket=send_bucket)
+    ...
+    await stop_outbox_workers(tasks)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Sequence
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.models import OutboxMessage
+from services.send_budget import DistributedTokenBucket
+from services.sender import GLOBAL_RATE, NotificationSender, TokenBucket, is_unreachable
+from services.user_service import mark_unreachable
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+OUTBOX_BATCH_SIZE = 100
+# A claimed batch must be sent within the lease, or other workers take it over
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_POLL_INTERVAL = 5.0
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF_BASE = 60.0
+OUTBOX_WORKER_CONCURRENCY = 10
+
+OUTBOX_KEEP_SENT_DAYS = 7
+OUTBOX_KEEP_FAILED_DAYS = 30
+PURGE_CHUNK_SIZE = 5000
+
+_ERROR_MAX_LEN = 500
+UNREACHABLE_ERROR = "user unreachable"
+
+
+@dataclass
+class OutboxResult:
+    """Outcome of one drained batch."""
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Table operations
+# ──────────────────────────────────────────────────────────────────────────────
+
+async def enqueue_messages(session: AsyncSession, messages: list[dict]) -> int:
+    """
+    Bulk-insert messages (dicts with user_id, kind, body) as pending.
+    Does not commit: the caller decides how much of a run is atomic.
+    """
+    if not messages:
+        return 0
+    await session.execute(insert(OutboxMessage), messages)
+    return len(messages)
+
+
+async def claim_outbox_batch(
+    session: AsyncSession,
+    batch_size: int = OUTBOX_BATCH_SIZE,
+    lease_seconds: float = OUTBOX_LEASE_SECONDS,
+) -> list[Row]:
+    """
+    Lease up to batch_size due messages to the caller and commit.
+    Rows locked by concurrent claimers are skipped, not waited for.
+    """
+    due = (
+        select(OutboxMessage.id)
+        .where(OutboxMessage.status == PENDING, OutboxMessage.available_at <= func.now())
+        .order_by(OutboxMessage.available_at, OutboxMessage.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(due))
+        .values(
+            attempts=OutboxMessage.attempts + 1,
+            available_at=func.now() + timedelta(seconds=lease_seconds),
+        )
+        .returning(OutboxMessage.id, OutboxMessage.user_id, OutboxMessage.body, OutboxMessage.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await session.execute(stmt)).all()
+    await session.commit()
+    return rows
+
+
+def _is_permanent(error: Exception) -> bool:
+    # Blocked bot, deleted chat, malformed message: retrying will not help
+    return isinstance(error, (TelegramForbiddenError, TelegramBadRequest))
+
+
+async def record_outbox_results(
+    session: AsyncSession,
+    rows: list[Row],
+    errors: dict[int, Exception | None],
+    max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+    backoff_base: float = OUTBOX_BACKOFF_BASE,
+) -> OutboxResult:
+    """
+    Store the outcome of a claimed batch and commit. `errors` maps outbox id
+    to the final send error, or None when the message was sent. Rows with
+    no entry (lost by the sender) are left to come back after the lease.
+    Users who turned out unreachable are marked and their pending messages
+    failed, in the same transaction.
+    """
+    result = OutboxResult()
+    unreachable: set[int] = set()
+    sent_ids = [row.id for row in rows if row.id in errors and errors[row.id] is None]
+    if sent_ids:
+        await session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(sent_ids))
+            .values(status=SENT, finished_at=func.now(), last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+        result.sent = len(sent_ids)
+
+    # Failures are rare, so they are written one by one
+    for row in rows:
+        error = errors.get(row.id)
+        if error is None:
+            continue
+        message = str(error)[:_ERROR_MAX_LEN]
+        if is_unreachable(error):
+            unreachable.add(row.user_id)
+        if _is_permanent(error) or row.attempts >= max_attempts:
+            values = dict(status=FAILED, finished_at=func.now(), last_error=message)
+            result.failed += 1
+        else:
+            delay = timedelta(seconds=backoff_base * 2 ** (row.attempts - 1))
+            values = dict(available_at=func.now() + delay, last_error=message)
+            result.retried += 1
+        await session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id == row.id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    if unreachable:
+        await mark_unreachable(session, unreachable)
+        # Whatever else is queued for them would fail the same way
+        dropped = await session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.user_id.in_(unreachable), OutboxMessage.status == PENDING)
+            .values(status=FAILED, finished_at=func.now(), last_error=UNREACHABLE_ERROR)
+            .execution_options(synchronize_session=False)
+        )
+        result.failed += dropped.rowcount
+
+    await session.commit()
+    return result
+
+
+async def purge_outbox(
+    session: AsyncSession,
+    keep_sent_days: int = OUTBOX_KEEP_SENT_DAYS,
+    keep_failed_days: int = OUTBOX_KEEP_FAILED_DAYS,
+    chunk_size: int = PURGE_CHUNK_SIZE,
+) -> int:
+    """Delete sent / failed messages older than their retention, in committed chunks."""
+    expired = or_(
+        and_(OutboxMessage.status == SENT, OutboxMessage.finished_at < func.now() - timedelta(days=keep_sent_days)),
+        and_(OutboxMessage.status == FAILED, OutboxMessage.finished_at < func.now() - timedelta(days=keep_failed_days)),
+    )
+    total = 0
+    while True:
+        chunk = select(OutboxMessage.id).where(expired).limit(chunk_size).scalar_subquery()
+        result = await session.execute(
+            delete(OutboxMessage)
+            .where(OutboxMessage.id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        total += result.rowcount
+        if result.rowcount < chunk_size:
+            return total
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Workers
+# ──────────────────────────────────────────────────────────────────────────────
+
+class OutboxWorker:
+    """Drains one shard's outbox until cancelled."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        session_factory: async_sessionmaker[AsyncSession],
+        bucket: TokenBucket | DistributedTokenBucket | None = None,
+        name: str = "outbox",
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        lease_seconds: float = OUTBOX_LEASE_SECONDS,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        concurrency: int = OUTBOX_WORKER_CONCURRENCY,
+    ) -> None:
+        self.bot = bot
+        self.session_factory = session_factory
+        self.bucket = bucket
+        self.name = name
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self._errors: dict[int, Exception | None] = {}
+
+    def _on_result(self, outbox_id: int, error: Exception | None) -> None:
+        self._errors[outbox_id] = error
+
+    async def run(self) -> None:
+        sender = NotificationSender(
+            self.bot,
+            concurrency=self.concurrency,
+            bucket=self.bucket,
+            on_result=self._on_result,
+        )
+        async with sender:
+            logger.info("Outbox worker %s started.", self.name)
+            while True:
+                try:
+                    drained = await self.drain_once(sender)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    logger.error("Outbox worker %s failed: %s", self.name, exc, exc_info=True)
+                    drained = 0
+                if not drained:
+                    await asyncio.sleep(self.poll_interval)
+
+    async def drain_once(self, sender: NotificationSender) -> int:
+        """Claim, send and record one batch; returns how many messages were claimed."""
+        async with self.session_factory() as session:
+            rows = await claim_outbox_batch(session, self.batch_size, self.lease_seconds)
+        if not rows:
+            return 0
+
+        self._errors = {}
+        for row in rows:
+            await sender.submit(row.user_id, row.body, ref=row.id)
+        await sender.wait_idle()
+        # Unreachable users are recorded from the per-message errors below
+        sender.unreachable.clear()
+
+        async with self.session_factory() as session:
+            result = await record_outbox_results(session, rows, self._errors)
+        logger.info(
+            "Outbox worker %s: %d sent, %d to retry, %d failed.",
+            self.name, result.sent, result.retried, result.failed,
+        )
+        return len(rows)
+
+
+def start_outbox_workers(
+    bot: Bot,
+    session_factories: Sequence[async_sessionmaker[AsyncSession]],
+    bucket: TokenBucket | DistributedTokenBucket | None = None,
+    per_shard: int = 1,
+) -> list[asyncio.Task]:
+    """Start `per_shard` workers for every shard's outbox; all share one bucket."""
+    bucket = bucket or TokenBucket(GLOBAL_RATE)
+    return [
+        asyncio.create_task(
+            OutboxWorker(bot, factory, bucket, name=f"{shard}.{n}").run(),
+            name=f"outbox-{shard}.{n}",
+        )
+        for shard, factory in enumerate(session_factories)
+        for n in range(per_shard)
+    ]
+
+
+async def stop_outbox_workers(tasks: list[asyncio.Task]) -> None:
+    """Cancel the workers; claimed but unsent rows come back after their lease."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
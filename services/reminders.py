@@ -0,0 +1,360 @@
+"""
+services/reminders.py — Payment reminders queued at their exact send time.
+
+The notification tick (services/scheduler.py) only looks every
+NOTIFY_TICK_MINUTES, so a subscription added or moved to "tomorrow" after
+the user's send time waited for the next tick. ReminderEngine, run by the
+scheduler leader, keeps every reminder due within REMINDER_HORIZON_HOURS
+(one per subscription and lead time) in a TimingWheel and queues each one
+at its send time (see send_time):
+
+- reconcile — every `reconcile_interval` seconds the window is reloaded
+  from every shard and the wheel is brought in line with it
+- events — bot handlers and web routes call
+  notify_reminders_changed(session, user_id) in the transaction that
+  changes a user's subscriptions or reminder settings. It is a Postgres
+  NOTIFY, delivered on commit to whichever replica is the leader; the
+  engine LISTENs on every shard and reloads just that user's reminders.
+  A reminder whose send time has already passed today fires at once.
+- firing — due users have their past-due dates advanced and are queued
+  with enqueue_planned_notifications, the same planner the tick uses.
+  Both claim ledger rows before queueing (claim_ledger), so when they
+  plan the same user at once only one of them queues each part.
+
+Usage in bot.py:
+    engine = ReminderEngine(db_helper.shards)
+    leader = LeaderElection(..., on_elected=engine.start, on_demoted=engine.stop)
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Collection, Hashable, Sequence
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import NotificationSettings, Subscription
+from services.lead_days import MAX_LEAD_DAYS, lead_days_list
+from services.notification_service import (
+    advance_past_due_payments,
+    enqueue_planned_notifications,
+    send_time,
+    user_zone,
+)
+from services.timing_wheel import Timer, TimingWheel
+from services.user_service import reachable
+
+if TYPE_CHECKING:
+    from database.db_helper import Shard
+
+logger = logging.getLogger(__name__)
+
+REMINDER_CHANNEL = "reminders_changed"
+
+REMINDER_HORIZON_HOURS = 48
+RECONCILE_INTERVAL = 600.0
+TICK_SECONDS = 1.0
+# Listener connections are pinged this often, so a dropped one is noticed and reopened
+LISTEN_PING_INTERVAL = 30.0
+
+
+async def notify_reminders_changed(session: AsyncSession, user_id: int) -> None:
+    """
+    Tell the reminder engine that the user's reminders may have changed.
+    Call before session.commit(): Postgres delivers the NOTIFY on commit
+    and drops it on rollback.
+    """
+    await session.execute(select(func.pg_notify(REMINDER_CHANNEL, str(user_id))))
+
+
+@dataclass(frozen=True)
+class Reminder:
+    shard: int
+    subscription_id: int
+    user_id: int
+    payment_date: date
+    lead: int = 1
+
+    @property
+    def day(self) -> date:
+        """The user's local date on which the reminder is sent."""
+        return self.payment_date - timedelta(days=self.lead)
+
+
+def _reminder_query(first: date, last: date, user_ids: Collection[int] | None = None):
+    """Active subscriptions of reachable users with reminders on and a payment between first and last."""
+    query = (
+        select(
+            Subscription.id,
+            Subscription.user_id,
+            Subscription.next_payment,
+            func.coalesce(Subscription.lead_days, NotificationSettings.lead_days).label("lead_days"),
+            NotificationSettings.timezone,
+            NotificationSettings.notify_hour,
+        )
+        .join(NotificationSettings, NotificationSettings.user_id == Subscription.user_id)
+        .where(
+            NotificationSettings.day_before.is_(True),
+            Subscription.is_active.is_(True),
+            Subscription.next_payment.between(first, last),
+            reachable(Subscription.user_id),
+        )
+    )
+    if user_ids is not None:
+        query = query.where(Subscription.user_id.in_(user_ids))
+    return query
+
+
+class ReminderEngine:
+    """Timing wheel of upcoming reminders for every shard; start() / stop() follow leadership."""
+
+    def __init__(
+        self,
+        shards: Sequence[Shard],
+        horizon_hours: float = REMINDER_HORIZON_HOURS,
+        reconcile_interval: float = RECONCILE_INTERVAL,
+        tick: float = TICK_SECONDS,
+    ) -> None:
+        self.shards = list(shards)
+        self.horizon = timedelta(hours=horizon_hours)
+        self.reconcile_interval = reconcile_interval
+        self.tick = tick
+        self._wheel = TimingWheel(time.time(), tick)
+        # (shard, user_id) -> keys of the user's timers
+        self._by_user: dict[tuple[int, int], set[Hashable]] = defaultdict(set)
+        # Reminders already queued, so a reconcile does not fire a passed send time again
+        self._fired: set[Reminder] = set()
+        # Users named by NOTIFY since the last tick
+        self._dirty: set[tuple[int, int]] = set()
+        self._reconcile_at = 0.0
+        self._task: asyncio.Task | None = None
+        self._stopping: asyncio.Task | None = None
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="reminders")
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._stopping, self._task = self._task, None
+
+    async def aclose(self) -> None:
+        """Stop and wait until the engine and its listeners are gone (on shutdown)."""
+        self.stop()
+        if self._stopping is not None:
+            await asyncio.gather(self._stopping, return_exceptions=True)
+            self._stopping = None
+
+    async def run(self) -> None:
+        """Listen, reconcile and fire until cancelled."""
+        self._reset()
+        listeners = [
+            asyncio.create_task(self._listen(index, shard), name=f"reminders-listen-{index}")
+            for index, shard in enumerate(self.shards)
+        ]
+        logger.info("Reminder engine started on %d shard(s).", len(self.shards))
+        try:
+            while True:
+                await self._step()
+                await asyncio.sleep(self.tick - time.time() % self.tick)
+        finally:
+            for task in listeners:
+                task.cancel()
+            await asyncio.gather(*listeners, return_exceptions=True)
+            logger.info("Reminder engine stopped.")
+
+    def _reset(self) -> None:
+        self._wheel = TimingWheel(time.time(), self.tick)
+        self._by_user.clear()
+        self._dirty.clear()
+        self._reconcile_at = 0.0
+
+    async def _step(self) -> None:
+        try:
+            if time.time() >= self._reconcile_at:
+                self._reconcile_at = time.time() + self.reconcile_interval
+                await self.reconcile()
+            if self._dirty:
+                await self._refresh_dirty()
+            await self._fire(self._wheel.advance(time.time()))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.error("Reminder engine step failed: %s", exc, exc_info=True)
+
+    # ── Loading ───────────────────────────────────────────────────────────
+
+    def _window(self, now: datetime) -> tuple[date, date]:
+        # Payment dates whose reminder day is in effect somewhere now, up to the horizon
+        return (now - timedelta(hours=12)).date(), (now + self.horizon + timedelta(days=MAX_LEAD_DAYS + 1)).date()
+
+    async def reconcile(self) -> None:
+        """Reload every shard's window and replace the wheel's timers with it."""
+        now = datetime.now(timezone.utc)
+        first, last = self._window(now)
+        self._fired = {reminder for reminder in self._fired if reminder.payment_date >= first}
+        for index, shard in enumerate(self.shards):
+            async with shard.session_factory() as session:
+                rows = (await session.execute(_reminder_query(first, last))).all()
+            self._sync(index, rows, now, users=None)
+        logger.info("Reminder engine reconciled: %d reminder(s) scheduled.", len(self._wheel))
+
+    async def _refresh_dirty(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        by_shard: dict[int, set[int]] = defaultdict(set)
+        for index, user_id in dirty:
+            by_shard[index].add(user_id)
+
+        now = datetime.now(timezone.utc)
+        first, last = self._window(now)
+        for index, user_ids in by_shard.items():
+            try:
+                async with self.shards[index].session_factory() as session:
+                    rows = (await session.execute(_reminder_query(first, last, user_ids))).all()
+            except Exception:
+                # Try again next tick
+                self._dirty.update((index, user_id) for user_id in user_ids)
+                raise
+            self._sync(index, rows, now, users=user_ids)
+
+    def _sync(self, index: int, rows, now: datetime, users: Collection[int] | None) -> None:
+        """Make the shard's timers (or only those of `users`) match `rows`."""
+        wanted: dict[Hashable, tuple[float, Reminder]] = {}
+        for row in rows:
+            for lead in lead_days_list(row.lead_days):
+                reminder = Reminder(index, row.id, row.user_id, row.next_payment, lead)
+                at = self._due_at(reminder, row.timezone, row.notify_hour, now)
+                if at is not None:
+                    wanted[(index, row.id, lead)] = (at, reminder)
+
+        if users is None:
+            owners = [owner for owner in self._by_user if owner[0] == index]
+        else:
+            owners = [(index, user_id) for user_id in users]
+        for owner in owners:
+            for key in list(self._by_user.get(owner, ())):
+                if key not in wanted:
+                    self._unschedule(key)
+
+        # Re-inserting is O(1), so unchanged timers are simply put back
+        for key, (at, reminder) in wanted.items():
+            self._schedule(key, at, reminder)
+
+    def _due_at(
+        self,
+        reminder: Reminder,
+        tz_name: str | None,
+        notify_hour: int | None,
+        now: datetime,
+    ) -> float | None:
+        """When to fire `reminder` (epoch seconds), or None if not now or not within the horizon."""
+        at = send_time(reminder.user_id, tz_name, notify_hour, reminder.day)
+        if at > now + self.horizon:
+            return None
+        if at <= now:
+            # Send time has passed: still send while it is that day for the user, once
+            if now.astimezone(user_zone(tz_name)).date() != reminder.day:
+                return None
+            if reminder in self._fired:
+                return None
+        return at.timestamp()
+
+    def _schedule(self, key: Hashable, at: float, reminder: Reminder) -> None:
+        self._unschedule(key)
+        self._wheel.insert(key, at, reminder)
+        self._by_user[(reminder.shard, reminder.user_id)].add(key)
+
+    def _unschedule(self, key: Hashable) -> None:
+        timer = self._wheel.cancel(key)
+        if timer is not None:
+            self._forget(timer)
+
+    def _forget(self, timer: Timer) -> None:
+        owner = (timer.payload.shard, timer.payload.user_id)
+        keys = self._by_user.get(owner)
+        if keys is not None:
+            keys.discard(timer.key)
+            if not keys:
+                del self._by_user[owner]
+
+    # ── Firing ────────────────────────────────────────────────────────────
+
+    async def _fire(self, timers: list[Timer]) -> None:
+        if not timers:
+            return
+        groups: dict[tuple[int, date], list[Reminder]] = defaultdict(list)
+        for timer in timers:
+            self._forget(timer)
+            reminder = timer.payload
+            groups[(reminder.shard, reminder.day)].append(reminder)
+
+        for (index, day), reminders in groups.items():
+            user_ids = {reminder.user_id for reminder in reminders}
+            try:
+                async with self.shards[index].session_factory() as session:
+                    # Plan from current dates, as the tick does
+                    await advance_past_due_payments(session, today=day, user_ids=user_ids)
+                    queued = await enqueue_planned_notifications(session, today=day, user_ids=user_ids)
+            except Exception as exc:
+                # Not marked as fired: the next reconcile schedules them again
+                logger.error(
+                    "Reminder engine [shard %d]: could not queue %d user(s): %s", index, len(user_ids), exc,
+                )
+                continue
+            self._fired.update(reminders)
+            logger.info(
+                "Reminder engine [shard %d]: %d reminder(s) due, queued %d message(s).",
+                index, len(reminders), queued,
+            )
+
+    # ── Events ────────────────────────────────────────────────────────────
+
+    def _on_notify(self, index: int, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            self._dirty.add((index, int(payload)))
+        except ValueError:
+            logger.warning("Ignoring reminder event with payload %r", payload)
+
+    async def _listen(self, index: int, shard: Shard) -> None:
+        """LISTEN on the shard's primary, reconnecting if the connection drops."""
+        listener = functools.partial(self._on_notify, index)
+        while True:
+            conn = None
+            try:
+                conn = await shard.engine.connect()
+                # Notifications are only delivered outside transactions
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                driver = (await conn.get_raw_connection()).driver_connection
+                await driver.add_listener(REMINDER_CHANNEL, listener)
+                # Events sent while nobody was listening are lost: reload everything
+                self._reconcile_at = 0.0
+                try:
+                    while True:
+                        await asyncio.sleep(LISTEN_PING_INTERVAL)
+                        await conn.execute(text("SELECT 1"))
+                finally:
+                    try:
+                        await driver.remove_listener(REMINDER_CHANNEL, listener)
+                    except Exception:
+                        pass
+            except asyncio.CancelledError:
+                if conn is not None:
+                    await conn.close()
+                raise
+            except Exception as exc:
+                logger.warning("Reminder listener [shard %d] failed, reconnecting: %s", index, exc)
+                if conn is not None:
+                    try:
+                        await conn.invalidate()
+                    except Exception:
+                        pass
+                await asyncio.sleep(LISTEN_PING_INTERVAL)
@@ -2,130 +2,354 @@
 services/scheduler.py — APScheduler integration running inside the bot process.
 
 Jobs:
-  Daily at 09:00 UTC (12:00 Moscow):
+  Every NOTIFY_TICK_MINUTES (15 by default):
+    For each calendar date currently in effect somewhere (see local_dates),
+    for users whose local date it is:
     1. advance_past_due_payments — roll forward overdue subscription dates
-    2. check_and_send_notifications — send "day before" reminders
+    2. enqueue_planned_notifications — one combined message per user whose
+       local send time (NotificationSettings.notify_hour in their timezone)
+       has come, with every kind due: "day before" reminders, plus the
+       weekly digest early in the week and the monthly report early in the
+       month. The ledger keeps later ticks from repeating it. Messages go
+       to the notification outbox; OutboxWorker tasks (services/outbox.py)
+       deliver them.
+       A tick plans only the users whose send time came since the last
+       recorded run (the first run of a day in their timezone: since
+       midnight); a tick with failed units is not recorded, so the next
+       one covers its users again.
+  Daily at 03:00 UTC:
+    purge_outbox / purge_ledger / purge_runs — delete delivered / failed
+    outbox rows, old notification ledger entries and finished work units
 
-  Every Monday at 09:00 UTC:
-    3. send_weekly_digest — weekly payments digest
+Users are spread over the day by their time zone and hour (and, within an
+hour, over several ticks), so there is no single 09:00 burst. Between
+ticks, the reminder engine (services/reminders.py) queues day-before
+reminders at their exact send time; the tick is its safety net.
 
-  1st of every month at 09:00 UTC:
-    4. send_monthly_report — monthly expense summary
+Restarts and deploys: job defaults coalesce a backlog of missed runs into
+one and still run a job up to `misfire_grace_seconds` late. The jobs
+themselves live in memory (their arguments are session factories, which
+cannot be stored), but every finished run is recorded in
+scheduler_job_state, and catch_up_missed_jobs — called when a replica
+becomes the leader — runs each job once at once if a scheduled run was
+missed while no leader was up. The notification job is idempotent (the
+ledger), and its kinds have their own catch-up window (CATCH_UP_DAYS), so
+one extra run is all it takes.
+
+With several database shards the jobs run on all shards in parallel;
+each shard holds a disjoint set of users and its own outbox. Within a
+shard each tick is split into user buckets recorded in job_run_units
+(services/job_units.py) and processed by several workers at once.
 
 Usage in bot.py:
-    from services.scheduler import create_scheduler
-    scheduler = create_scheduler(bot=bot, session_factory=session_factory)
+    from services.scheduler import catch_up_missed_jobs, create_scheduler
+    scheduler = create_scheduler(session_factories=[...one per shard...])
     scheduler.start()
+    await catch_up_missed_jobs(scheduler, session_factories[0])
     ...
     scheduler.shutdown()
 """
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Callable
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Sequence
 
-from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from database.models import SchedulerJobState
+
 from services.notification_service import (
     advance_past_due_payments,
-    check_and_send_notifications,
-    send_monthly_report,
-    send_weekly_digest,
+    enqueue_planned_notifications,
+    local_dates,
+    purge_ledger,
+)
+from services.job_units import (
+    DEFAULT_UNITS,
+    DEFAULT_WORKERS,
+    DONE,
+    UnitResult,
+    create_run,
+    purge_runs,
+    run_progress,
+    work_units,
 )
+from services.outbox import purge_outbox
 
 logger = logging.getLogger(__name__)
 
+NOTIFY_TICK_MINUTES = 15
+MISFIRE_GRACE_SECONDS = 300
+
 
 def create_scheduler(
-    bot: Bot,
-    session_factory: async_sessionmaker[AsyncSession],
+    session_factories: Sequence[async_sessionmaker[AsyncSession]],
+    units: int = DEFAULT_UNITS,
+    workers: int = DEFAULT_WORKERS,
+    tick_minutes: int = NOTIFY_TICK_MINUTES,
+    misfire_grace_seconds: int = MISFIRE_GRACE_SECONDS,
+    coalesce: bool = True,
+    state_factory: async_sessionmaker[AsyncSession] | None = None,
 ) -> AsyncIOScheduler:
     """
     Create and configure the APScheduler instance.
 
+    session_factories has one entry per database shard. The jobs run on the
+    primary: they write, and the notification scan must see the dates it
+    has just advanced. Each tick is split into `units` user buckets per
+    shard, processed by `workers` parallel workers.
+
+    A run may start up to misfire_grace_seconds late; with `coalesce`,
+    several missed runs of a job are made up by one. Finished runs are
+    recorded through state_factory (default: the first shard) for
+    catch_up_missed_jobs.
+
     Call scheduler.start() after creation to begin the jobs.
     Call scheduler.shutdown() on application shutdown.
     """
-    scheduler = AsyncIOScheduler(timezone="UTC")
-
-    # ── Daily job: advance past-due dates + send day-before reminders ──────
-    scheduler.add_job(
-        _daily_job,
-        trigger="cron",
-        hour=9,
-        minute=0,
-        kwargs={"bot": bot, "session_factory": session_factory},
-        id="daily_notifications",
-        replace_existing=True,
+    scheduler = AsyncIOScheduler(
+        timezone="UTC",
+        job_defaults={"coalesce": coalesce, "misfire_grace_time": misfire_grace_seconds, "max_instances": 1},
     )
+    session_factories = list(session_factories)
+    state_factory = state_factory or session_factories[0]
 
-    # ── Weekly job: Monday digest ──────────────────────────────────────────
+    # ── Notification tick: advance past-due dates + queue messages whose local send time has come ──
     scheduler.add_job(
-        _weekly_job,
+        _tracked,
         trigger="cron",
-        day_of_week="mon",
-        hour=9,
-        minute=0,
-        kwargs={"bot": bot, "session_factory": session_factory},
-        id="weekly_digest",
+        minute=f"*/{tick_minutes}",
+        args=["notifications", _notify_job, state_factory],
+        kwargs={
+            "session_factories": session_factories,
+            "units": units,
+            "workers": workers,
+            "state_factory": state_factory,
+        },
+        id="notifications",
         replace_existing=True,
     )
 
-    # ── Monthly job: 1st of every month ───────────────────────────────────
+    # ── Outbox, ledger and work unit retention ──
     scheduler.add_job(
-        _monthly_job,
+        _tracked,
         trigger="cron",
-        day=1,
-        hour=9,
+        hour=3,
         minute=0,
-        kwargs={"bot": bot, "session_factory": session_factory},
-        id="monthly_report",
+        args=["outbox_purge", _purge_job, state_factory],
+        kwargs={"session_factories": session_factories},
+        id="outbox_purge",
         replace_existing=True,
     )
 
-    logger.info("Scheduler configured with 3 jobs (daily, weekly, monthly).")
+    logger.info("Scheduler configured with 2 jobs over %d shard(s).", len(session_factories))
     return scheduler
 
 
 # ──────────────────────────────────────────────────────────────────────────────
-# Job wrappers — each opens its own DB session
+# Run tracking and catch-up
 # ──────────────────────────────────────────────────────────────────────────────
 
-async def _daily_job(bot: Bot, session_factory: async_sessionmaker[AsyncSession]) -> None:
-    """Advance past-due payments then send day-before reminders."""
-    logger.info("Running daily job: advance_past_due_payments + check_and_send_notifications")
-    async with session_factory() as session:
-        try:
-            advanced = await advance_past_due_payments(session)
-            logger.info("Daily job: advanced %d subscription(s).", advanced)
-        except Exception as exc:
-            logger.error("Daily job — advance_past_due_payments failed: %s", exc, exc_info=True)
-
-    async with session_factory() as session:
-        try:
-            await check_and_send_notifications(bot, session)
-            logger.info("Daily job: notifications sent.")
-        except Exception as exc:
-            logger.error("Daily job — check_and_send_notifications failed: %s", exc, exc_info=True)
-
-
-async def _weekly_job(bot: Bot, session_factory: async_sessionmaker[AsyncSession]) -> None:
-    """Send weekly digest to subscribed users."""
-    logger.info("Running weekly digest job.")
-    async with session_factory() as session:
-        try:
-            await send_weekly_digest(bot, session)
-        except Exception as exc:
-            logger.error("Weekly job failed: %s", exc, exc_info=True)
-
-
-async def _monthly_job(bot: Bot, session_factory: async_sessionmaker[AsyncSession]) -> None:
-    """Send monthly expense report to subscribed users."""
-    logger.info("Running monthly report job.")
-    async with session_factory() as session:
-        try:
-            await send_monthly_report(bot, session)
-        except Exception as exc:
-            logger.error("Monthly job failed: %s", exc, exc_info=True)
+async def _tracked(
+    job_id: str,
+    job: Callable[..., Awaitable[Any]],
+    state_factory: async_sessionmaker[AsyncSession],
+    **kwargs: Any,
+) -> None:
+    """Run `job` and record the run's start time in scheduler_job_state."""
+    started = datetime.now(timezone.utc)
+    await job(**kwargs)
+    try:
+        async with state_factory() as session:
+            await record_job_run(session, job_id, started)
+    except Exception as exc:
+        logger.warning("Could not record run of job %s: %s", job_id, exc)
+
+
+async def record_job_run(session: AsyncSession, job_id: str, started: datetime) -> None:
+    """Upsert the job's last run (started: aware UTC) and commit."""
+    stmt = pg_insert(SchedulerJobState).values(job_id=job_id, last_run_at=started.replace(tzinfo=None))
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[SchedulerJobState.job_id],
+            set_={"last_run_at": stmt.excluded.last_run_at, "finished_at": func.now()},
+        )
+    )
+    await session.commit()
+
+
+async def catch_up_missed_jobs(
+    scheduler: AsyncIOScheduler,
+    state_factory: async_sessionmaker[AsyncSession],
+) -> list[str]:
+    """
+    Run once, now, every job that had a scheduled run after its last recorded
+    run (or was never recorded). Goes through the scheduler, so coalescing
+    and max_instances still apply. Returns the ids of the jobs moved up.
+    """
+    try:
+        async with state_factory() as session:
+            rows = await session.execute(select(SchedulerJobState.job_id, SchedulerJobState.last_run_at))
+            last_runs = dict(rows.all())
+    except Exception as exc:
+        # The regular schedule still runs; the next tick picks up most of what was missed
+        logger.error("Could not read scheduler job state, skipping catch-up: %s", exc, exc_info=True)
+        return []
+
+    now = datetime.now(timezone.utc)
+    missed = []
+    for job in scheduler.get_jobs():
+        last_run = last_runs.get(job.id)
+        if last_run is not None:
+            # The first fire time strictly after the last run
+            after = last_run.replace(tzinfo=timezone.utc) + timedelta(seconds=1)
+            due = job.trigger.get_next_fire_time(None, after)
+            if due is None or due > now:
+                continue
+        scheduler.modify_job(job.id, next_run_time=now)
+        missed.append(job.id)
+
+    if missed:
+        logger.info("Catching up missed scheduler job(s): %s", ", ".join(missed))
+    return missed
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Job wrappers — fan out over shards; each shard run opens its own DB session
+# ──────────────────────────────────────────────────────────────────────────────
+
+async def _notify_job(
+    session_factories: Sequence[async_sessionmaker[AsyncSession]],
+    units: int = DEFAULT_UNITS,
+    workers: int = DEFAULT_WORKERS,
+    state_factory: async_sessionmaker[AsyncSession] | None = None,
+) -> None:
+    """
+    Advance past-due payments then queue the notifications now due, unit by
+    unit, for the users whose send time came since the last recorded run.
+    Raises if a unit did not finish, so the run is not recorded.
+    """
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    run_key = f"notify:{now:%Y-%m-%dT%H:%M}"
+    dates = local_dates(now)
+    since = await _last_run(state_factory, "notifications") if state_factory is not None else None
+    logger.info(
+        "Running notification job %s: %d unit(s) x %d worker(s) per shard, since %s",
+        run_key, units, workers, since or "start of day",
+    )
+    results = await asyncio.gather(
+        *(
+            _notify_shard_job(shard, factory, run_key, dates, units, workers, since)
+            for shard, factory in enumerate(session_factories)
+        )
+    )
+    total = sum((result for result, _ in results), UnitResult())
+    logger.info(
+        "Notification job %s: advanced %d subscription(s), queued %d notification(s).",
+        run_key, total.advanced, total.queued,
+    )
+    incomplete = [shard for shard, (_, complete) in enumerate(results) if not complete]
+    if incomplete:
+        raise RuntimeError(f"notification job {run_key} did not finish on shard(s) {incomplete}")
+
+
+async def _last_run(state_factory: async_sessionmaker[AsyncSession], job_id: str) -> datetime | None:
+    """The job's last recorded run (aware UTC), None if never recorded or unreadable."""
+    try:
+        async with state_factory() as session:
+            last_run = await session.scalar(
+                select(SchedulerJobState.last_run_at).where(SchedulerJobState.job_id == job_id)
+            )
+    except Exception as exc:
+        logger.warning("Could not read last run of job %s, planning the whole day: %s", job_id, exc)
+        return None
+    return last_run.replace(tzinfo=timezone.utc) if last_run is not None else None
+
+
+async def _notify_shard_job(
+    shard: int,
+    session_factory: async_sessionmaker[AsyncSession],
+    run_key: str,
+    dates: list[date],
+    units: int,
+    workers: int,
+    since: datetime | None = None,
+) -> tuple[UnitResult, bool]:
+    """The shard's totals, and whether every unit finished."""
+    try:
+        async with session_factory() as session:
+            await create_run(session, run_key, units)
+    except Exception as exc:
+        logger.error(
+            "Notification job [shard %d] — could not create run %s: %s", shard, run_key, exc, exc_info=True
+        )
+        return UnitResult(), False
+
+    async def handle(part: tuple[int, int]) -> UnitResult:
+        return await _notify_unit(session_factory, dates, part, since)
+
+    results = await asyncio.gather(
+        *(work_units(session_factory, run_key, handle) for _ in range(workers)),
+        return_exceptions=True,
+    )
+    total = UnitResult()
+    complete = True
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(
+                "Notification job [shard %d] — unit worker failed: %s", shard, result, exc_info=result
+            )
+            complete = False
+        else:
+            total += result
+
+    try:
+        async with session_factory() as session:
+            progress = await run_progress(session, run_key)
+    except Exception as exc:
+        logger.error("Notification job [shard %d] — could not read progress of %s: %s", shard, run_key, exc)
+        return total, False
+    logger.info(
+        "Notification job [shard %d]: units %s, advanced %d, queued %d.",
+        shard, progress, total.advanced, total.queued,
+    )
+    return total, complete and set(progress) <= {DONE}
+
+
+async def _notify_unit(
+    session_factory: async_sessionmaker[AsyncSession],
+    dates: list[date],
+    part: tuple[int, int],
+    since: datetime | None = None,
+) -> UnitResult:
+    """One work unit: advance and queue for its users, per local date in effect."""
+    result = UnitResult()
+    for today in dates:
+        async with session_factory() as session:
+            result.advanced += await advance_past_due_payments(session, today=today, part=part, local=True)
+        async with session_factory() as session:
+            result.queued += await enqueue_planned_notifications(
+                session, today=today, part=part, local=True, since=since
+            )
+    return result
+
+
+async def _purge_job(session_factories: Sequence[async_sessionmaker[AsyncSession]]) -> None:
+    """Delete finished outbox rows, old ledger entries and finished work units on every shard."""
+    for shard, session_factory in enumerate(session_factories):
+        async with session_factory() as session:
+            try:
+                purged = await purge_outbox(session)
+                expired = await purge_ledger(session)
+                units = await purge_runs(session)
+                logger.info(
+                    "Purge [shard %d]: deleted %d outbox row(s), %d ledger row(s), %d work unit(s).",
+                    shard, purged, expired, units,
+                )
+            except Exception as exc:
+                logger.error("Purge [shard %d] failed: %s", shard, exc, exc_info=True)
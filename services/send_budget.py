@@ -0,0 +1,259 @@
+"""
+services/send_budget.py — Telegram send budget shared by every process using the bot token.
+
+Telegram's ~30 msg/s limit applies per bot token, not per process. When the
+bot, the web app and workers all send with one token, each local TokenBucket
+would allow the full rate and together they would trip 429s. The
+DistributedTokenBucket here keeps the bucket state in a RateStore shared by
+all of them:
+
+- PostgresRateStore — one row in `send_budget`, refilled and debited by a
+  single UPDATE ... RETURNING (the row lock serialises processes)
+- MemoryRateStore   — the same arithmetic in process memory, for one
+  process or tests
+
+Other sends through the bot draw from the budget via SendBudgetMiddleware,
+an aiogram request middleware. Replies to a user's update are not charged
+(interactive_replies): there is at most one per incoming update, and
+TELEGRAM_SEND_RATE stays below Telegram's limit to leave room for them, so
+they need no round trip to the shared row. A 429 on any send still pauses
+the budget. NotificationSender takes its tokens itself and marks its sends
+as precharged so they are not counted twice.
+
+Usage:
+    bucket = DistributedTokenBucket(PostgresRateStore(db_helper.session_factory), key=f"bot:{bot.id}")
+    bot.session.middleware(SendBudgetMiddleware(bucket))
+    dp.update.outer_middleware(InteractiveRepliesMiddleware())  # middlewares/send_budget.py
+    async with NotificationSender(bot, bucket=bucket) as sender:
+        ...
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Protocol
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+# How many tokens one store round trip may take; spares are spent locally
+DEFAULT_BATCH = 2
+
+# Set inside NotificationSender workers: their sends already hold a token
+_precharged: contextvars.ContextVar[bool] = contextvars.ContextVar("send_budget_precharged", default=False)
+
+
+# Set while the dispatcher handles an update: sends are replies to it
+_interactive: contextvars.ContextVar[bool] = contextvars.ContextVar("send_budget_interactive", default=False)
+
+
+def mark_precharged() -> None:
+    """Tell SendBudgetMiddleware that sends from the current task are already paid for."""
+    _precharged.set(True)
+
+
+@contextmanager
+def interactive_replies() -> Iterator[None]:
+    """Sends inside the block answer a user's update: SendBudgetMiddleware does not charge them."""
+    token = _interactive.set(True)
+    try:
+        yield
+    finally:
+        _interactive.reset(token)
+
+
+class RateStore(Protocol):
+    """Shared token-bucket state, keyed by bucket name."""
+
+    async def take(self, key: str, rate: float, capacity: float, want: int) -> tuple[int, float]:
+        """Take up to `want` tokens; returns (granted, seconds to wait if none were granted)."""
+        ...
+
+    async def pause(self, key: str, seconds: float) -> None:
+        """Grant no tokens from `key` for `seconds`."""
+        ...
+
+
+class MemoryRateStore:
+    """RateStore kept in this process. Buckets with the same key share state."""
+
+    def __init__(self) -> None:
+        # key -> [tokens, updated, paused_until]
+        self._buckets: dict[str, list[float]] = {}
+
+    async def take(self, key: str, rate: float, capacity: float, want: int) -> tuple[int, float]:
+        now = time.monotonic()
+        state = self._buckets.setdefault(key, [capacity, now, 0.0])
+        tokens = min(capacity, state[0] + (now - state[1]) * rate)
+        state[1] = now
+        if now < state[2]:
+            state[0] = tokens
+            return 0, state[2] - now
+        granted = min(int(tokens), want)
+        state[0] = tokens - granted
+        if granted:
+            return granted, 0.0
+        return 0, (1 - tokens) / rate
+
+    async def pause(self, key: str, seconds: float) -> None:
+        now = time.monotonic()
+        state = self._buckets.setdefault(key, [0.0, now, 0.0])
+        state[0] = 0.0
+        state[1] = now
+        state[2] = max(state[2], now + seconds)
+
+
+# Times are epoch seconds from the database clock, so all processes agree on them
+_PG_INIT = text(
+    "INSERT INTO send_budget (key, tokens, updated_at, paused_until) "
+    "VALUES (:key, CAST(:capacity AS float8), extract(epoch FROM clock_timestamp())::float8, 0) "
+    "ON CONFLICT (key) DO NOTHING"
+)
+
+_PG_TAKE = text("""
+WITH cur AS (
+    SELECT b.key,
+           b.paused_until,
+           now_.t,
+           LEAST(CAST(:capacity AS float8), b.tokens + GREATEST(now_.t - b.updated_at, 0) * CAST(:rate AS float8)) AS avail
+    FROM send_budget b,
+         (SELECT extract(epoch FROM clock_timestamp())::float8 AS t) now_
+    WHERE b.key = :key
+    FOR UPDATE OF b
+), grant_ AS (
+    SELECT cur.*,
+           CASE WHEN cur.t < cur.paused_until THEN 0
+                ELSE LEAST(floor(cur.avail)::int, CAST(:want AS int)) END AS granted
+    FROM cur
+)
+UPDATE send_budget b
+SET tokens = g.avail - g.granted,
+    updated_at = g.t
+FROM grant_ g
+WHERE b.key = g.key
+RETURNING g.granted,
+          CASE WHEN g.t < g.paused_until THEN g.paused_until - g.t
+               WHEN g.granted > 0 THEN 0
+               ELSE (1 - g.avail) / CAST(:rate AS float8) END AS retry_in
+""")
+
+_PG_PAUSE = text(
+    "UPDATE send_budget "
+    "SET tokens = 0, "
+    "    updated_at = extract(epoch FROM clock_timestamp())::float8, "
+    "    paused_until = GREATEST(paused_until, extract(epoch FROM clock_timestamp())::float8 + CAST(:seconds AS float8)) "
+    "WHERE key = :key"
+)
+
+
+class PostgresRateStore:
+    """RateStore in the `send_budget` table; every process using the token shares its row."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        self.session_factory = session_factory
+        self._known_keys: set[str] = set()
+
+    async def take(self, key: str, rate: float, capacity: float, want: int) -> tuple[int, float]:
+        async with self.session_factory() as session:
+            if key not in self._known_keys:
+                await session.execute(_PG_INIT, {"key": key, "capacity": capacity})
+                self._known_keys.add(key)
+            row = (
+                await session.execute(_PG_TAKE, {"key": key, "rate": rate, "capacity": capacity, "want": want})
+            ).one()
+            await session.commit()
+        return int(row.granted), float(row.retry_in)
+
+    async def pause(self, key: str, seconds: float) -> None:
+        async with self.session_factory() as session:
+            await session.execute(_PG_PAUSE, {"key": key, "seconds": seconds})
+            await session.commit()
+
+
+class DistributedTokenBucket:
+    """
+    Token bucket whose state lives in a RateStore. Drop-in for
+    services.sender.TokenBucket: `rate` tokens per second across all
+    processes sharing `key`, bursts up to `capacity`.
+    """
+
+    def __init__(
+        self,
+        store: RateStore,
+        key: str,
+        rate: float,
+        capacity: float | None = None,
+        batch: int = DEFAULT_BATCH,
+    ) -> None:
+        self.store = store
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.batch = max(1, batch)
+        self._local = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while not self._local:
+                try:
+                    granted, retry_in = await self.store.take(self.key, self.rate, self.capacity, self.batch)
+                except Exception as exc:
+                    # Store unavailable: fall back to the local pace rather than stop sending
+                    logger.warning("Send budget store unavailable, pacing locally: %s", exc)
+                    await asyncio.sleep(1 / self.rate)
+                    self._local = 1
+                    break
+                if granted:
+                    self._local = granted
+                    break
+                await asyncio.sleep(retry_in)
+            self._local -= 1
+
+    async def pause(self, seconds: float) -> None:
+        """Hand out no tokens, in any process, for `seconds` (after a 429 from Telegram)."""
+        self._local = 0
+        try:
+            await self.store.pause(self.key, seconds)
+        except Exception as exc:
+            logger.warning("Could not pause send budget %s: %s", self.key, exc)
+
+
+class SendBudgetMiddleware(BaseRequestMiddleware):
+    """
+    aiogram request middleware: every send* call made through the bot takes
+    a token from `bucket`, except replies (see interactive_replies), and a
+    429 pauses the bucket for everyone.
+
+        bot.session.middleware(SendBudgetMiddleware(bucket))
+    """
+
+    def __init__(self, bucket: DistributedTokenBucket) -> None:
+        self.bucket = bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        api_method = method.__api_method__
+        if _precharged.get() or not api_method.startswith("send") or api_method == "sendChatAction":
+            return await make_request(bot, method)
+        if not _interactive.get():
+            await self.bucket.acquire()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as exc:
+            await self.bucket.pause(exc.retry_after)
+            raise
@@ -0,0 +1,247 @@
+"""
+services/sender.py — Concurrent, rate-limit-aware Telegram message sender.
+
+Telegram allows roughly 30 messages per second per bot token and about one
+message per second per chat. NotificationSender pushes messages through a
+small pool of worker tasks that:
+
+- take a token from a global bucket before every send (a local
+  TokenBucket, or the cluster-wide one from services/send_budget.py)
+- keep at least PER_CHAT_INTERVAL seconds between messages to one chat
+- on TelegramRetryAfter (429) pause the whole bucket for retry_after
+  seconds and requeue the message
+- retry network / server errors with exponential backoff
+- give up immediately on Forbidden / BadRequest (blocked bot, bad chat);
+  chats that are gone for good (is_unreachable) are collected in
+  `sender.unreachable` for the caller to mark (user_service.mark_unreachable)
+
+Usage:
+    async with NotificationSender(bot) as sender:
+        for user_id, text in messages:
+            await sender.submit(user_id, text)
+    logger.info("%s", sender.report)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from services.send_budget import DistributedTokenBucket, mark_precharged
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 20
+# Stay a little under Telegram's ~30 msg/s so other bot traffic has headroom
+GLOBAL_RATE = 25.0
+PER_CHAT_INTERVAL = 1.0
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+# Per-chat send times are swept of past entries once the map reaches this size (then twice its live size)
+CHAT_TIMES_PRUNE_SIZE = 1000
+
+
+def is_unreachable(error: Exception | None) -> bool:
+    """The user blocked the bot, was deactivated or the chat does not exist: no send will ever succeed."""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and "chat not found" in str(error).lower()
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # The lock makes waiters queue up in order instead of racing for tokens
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def pause(self, seconds: float) -> None:
+        """Hand out no tokens for `seconds` (after a 429 from Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        # Refill starts when the pause ends, so the bucket does not come back full
+        self._updated = self._paused_until
+
+
+@dataclass
+class SendReport:
+    sent: int = 0
+    failed: int = 0
+    throttled: int = 0
+
+
+@dataclass
+class _Outgoing:
+    chat_id: int
+    text: str
+    ref: Any = None
+    attempts: int = 0
+    not_before: float = 0.0
+
+
+class NotificationSender:
+    """
+    Bounded-concurrency sender sharing one bucket across its workers: a local
+    TokenBucket by default, or a DistributedTokenBucket shared with other processes.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        bucket: TokenBucket | DistributedTokenBucket | None = None,
+        per_chat_interval: float = PER_CHAT_INTERVAL,
+        max_attempts: int = MAX_ATTEMPTS,
+        parse_mode: str = "HTML",
+        on_result: Callable[[Any, Exception | None], None] | None = None,
+    ) -> None:
+        self.bot = bot
+        self.concurrency = concurrency
+        self.bucket = bucket or TokenBucket(GLOBAL_RATE)
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.parse_mode = parse_mode
+        # Called once per submitted message with its ref and None (sent) or the final error
+        self.on_result = on_result
+        self.report = SendReport()
+        # Chats that failed with an is_unreachable() error
+        self.unreachable: set[int] = set()
+
+        self._queue: asyncio.Queue[_Outgoing] = asyncio.Queue()
+        # Backpressure: submit() waits while this many messages are in flight
+        self._slots = asyncio.Semaphore(concurrency * 10)
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._next_chat_send: dict[int, float] = {}
+        self._prune_at = CHAT_TIMES_PRUNE_SIZE
+        self._workers: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> NotificationSender:
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        try:
+            if exc_info[0] is None:
+                await self._idle.wait()
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+
+    async def submit(self, chat_id: int, text: str, ref: Any = None) -> None:
+        """Queue a message; returns once it is accepted, not when it is sent."""
+        await self._slots.acquire()
+        self._pending += 1
+        self._idle.clear()
+        self._queue.put_nowait(_Outgoing(chat_id, text, ref))
+
+    async def wait_idle(self) -> None:
+        """Wait until every submitted message has been sent or has failed."""
+        await self._idle.wait()
+
+    def _done(self, msg: _Outgoing, error: Exception | None = None) -> None:
+        if self.on_result is not None:
+            try:
+                self.on_result(msg.ref, error)
+            except Exception:
+                logger.exception("on_result callback failed for message to %s", msg.chat_id)
+        self._slots.release()
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+
+    def _requeue(self, msg: _Outgoing, delay: float) -> None:
+        msg.not_before = time.monotonic() + delay
+        self._queue.put_nowait(msg)
+
+    async def _worker(self) -> None:
+        # Sends paid from the shared budget must not be charged again by SendBudgetMiddleware;
+        # with a local bucket the middleware (if installed) still charges the shared one
+        if isinstance(self.bucket, DistributedTokenBucket):
+            mark_precharged()
+        while True:
+            msg = await self._queue.get()
+            delay = msg.not_before - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._send(msg)
+
+    async def _send(self, msg: _Outgoing) -> None:
+        chat_wait = self._next_chat_send.get(msg.chat_id, 0.0) - time.monotonic()
+        if chat_wait > 0:
+            await asyncio.sleep(chat_wait)
+        await self.bucket.acquire()
+        self._note_chat_send(msg.chat_id)
+        msg.attempts += 1
+
+        try:
+            await self.bot.send_message(msg.chat_id, msg.text, parse_mode=self.parse_mode)
+        except TelegramRetryAfter as exc:
+            self.report.throttled += 1
+            await self.bucket.pause(exc.retry_after)
+            if msg.attempts < self.max_attempts:
+                logger.info("Rate limited sending to %s, retrying in %ss", msg.chat_id, exc.retry_after)
+                self._requeue(msg, exc.retry_after)
+                return
+            self._fail(msg, exc)
+        except (TelegramForbiddenError, TelegramBadRequest) as exc:
+            self._fail(msg, exc)
+        except (TelegramNetworkError, TelegramServerError) as exc:
+            if msg.attempts < self.max_attempts:
+                self._requeue(msg, BACKOFF_BASE * 2 ** (msg.attempts - 1))
+                return
+            self._fail(msg, exc)
+        except Exception as exc:
+            self._fail(msg, exc)
+        else:
+            self.report.sent += 1
+            logger.debug("Sent message to %s", msg.chat_id)
+            self._done(msg)
+
+    def _note_chat_send(self, chat_id: int) -> None:
+        now = time.monotonic()
+        if len(self._next_chat_send) >= self._prune_at:
+            # Long-lived senders (outbox workers) would otherwise keep every chat ever sent to
+            self._next_chat_send = {chat: at for chat, at in self._next_chat_send.items() if at > now}
+            self._prune_at = max(CHAT_TIMES_PRUNE_SIZE, 2 * len(self._next_chat_send))
+        self._next_chat_send[chat_id] = now + self.per_chat_interval
+
+    def _fail(self, msg: _Outgoing, exc: Exception) -> None:
+        self.report.failed += 1
+        if is_unreachable(exc):
+            self.unreachable.add(msg.chat_id)
+        logger.warning("Failed to send message to %s after %d attempt(s): %s", msg.chat_id, msg.attempts, exc)
+        self._done(msg, exc)
@@ -0,0 +1,140 @@
+"""
+services/timing_wheel.py — Hierarchical timing wheel for keyed timers.
+
+A wheel of wheels (Varghese & Lauck): level 0 has one slot per tick,
+every higher level one slot per full turn of the level below. With the
+default levels (60, 60, 24, 8) and 1 s ticks that is seconds, minutes,
+hours and days, covering 8 days; timers further out wait in an overflow
+bucket until the top level comes round.
+
+- insert(key, at, payload) — O(1); replaces the key's previous timer
+- cancel(key)              — O(1)
+- advance(now)             — move the clock to `now` and return the timers
+  that came due, cascading higher-level slots down as their turn comes
+
+Times are plain epoch seconds; the wheel never reads a clock itself.
+
+Usage:
+    wheel = TimingWheel(time.time())
+    wheel.insert(("sub", 42), at=due_ts, payload=reminder)
+    ...
+    for timer in wheel.advance(time.time()):
+        fire(timer.payload)
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Any, Hashable, Sequence
+
+# Slots per level: seconds, minutes, hours, days
+DEFAULT_LEVELS = (60, 60, 24, 8)
+
+
+@dataclass
+class Timer:
+    key: Hashable
+    due: int  # tick number
+    payload: Any = None
+
+
+class TimingWheel:
+    """Keyed timers bucketed by due tick; not thread-safe, use from one event loop."""
+
+    def __init__(self, start: float, tick: float = 1.0, levels: Sequence[int] = DEFAULT_LEVELS) -> None:
+        self.tick = tick
+        self.levels = tuple(levels)
+        # _spans[i]: ticks covered by one slot of level i; _spans[-1]: the whole wheel
+        self._spans = [1]
+        for size in self.levels:
+            self._spans.append(self._spans[-1] * size)
+        self._slots: list[list[dict[Hashable, Timer]]] = [[{} for _ in range(size)] for size in self.levels]
+        self._overflow: dict[Hashable, Timer] = {}
+        self._expired: dict[Hashable, Timer] = {}
+        # key -> the bucket holding its timer, for O(1) cancel
+        self._where: dict[Hashable, dict[Hashable, Timer]] = {}
+        self.now_tick = self._to_tick(start)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def get(self, key: Hashable) -> Timer | None:
+        bucket = self._where.get(key)
+        return bucket[key] if bucket is not None else None
+
+    def due_at(self, timer: Timer) -> float:
+        """Epoch seconds at which `timer` fires."""
+        return timer.due * self.tick
+
+    def insert(self, key: Hashable, at: float, payload: Any = None) -> Timer:
+        """Schedule `key` at `at`; a time already past fires on the next advance()."""
+        self.cancel(key)
+        timer = Timer(key, self._to_tick(at), payload)
+        self._place(timer)
+        return timer
+
+    def cancel(self, key: Hashable) -> Timer | None:
+        bucket = self._where.pop(key, None)
+        if bucket is None:
+            return None
+        return bucket.pop(key)
+
+    def advance(self, now: float) -> list[Timer]:
+        """Move the clock forward to `now`; returns the timers due by then, in tick order."""
+        target = self._to_tick(now)
+        fired = self._take(self._expired)
+        if not self._where:
+            # Nothing scheduled: no slot to visit on the way
+            self.now_tick = max(self.now_tick, target)
+            return fired
+
+        while self.now_tick < target:
+            self.now_tick += 1
+            self._cascade(self.now_tick)
+            fired += self._take(self._slots[0][self.now_tick % self.levels[0]])
+            fired += self._take(self._expired)
+        return fired
+
+    def _to_tick(self, at: float) -> int:
+        return math.floor(at / self.tick)
+
+    def _place(self, timer: Timer) -> None:
+        if timer.due <= self.now_tick:
+            bucket = self._expired
+        else:
+            # The lowest level whose current turn still includes the due tick
+            for level, size in enumerate(self.levels):
+                turn = self._spans[level + 1]
+                if timer.due // turn == self.now_tick // turn:
+                    bucket = self._slots[level][(timer.due // self._spans[level]) % size]
+                    break
+            else:
+                bucket = self._overflow
+        bucket[timer.key] = timer
+        self._where[timer.key] = bucket
+
+    def _cascade(self, tick: int) -> None:
+        # Top-down, so a timer can drop several levels within one tick
+        if tick % self._spans[-1] == 0:
+            self._replace(self._overflow)
+        for level in range(len(self.levels) - 1, 0, -1):
+            if tick % self._spans[level] == 0:
+                self._replace(self._slots[level][(tick // self._spans[level]) % self.levels[level]])
+
+    def _replace(self, bucket: dict[Hashable, Timer]) -> None:
+        timers = list(bucket.values())
+        bucket.clear()
+        for timer in timers:
+            self._place(timer)
+
+    def _take(self, bucket: dict[Hashable, Timer]) -> list[Timer]:
+        if not bucket:
+            return []
+        timers = list(bucket.values())
+        bucket.clear()
+        for timer in timers:
+            del self._where[timer.key]
+        return timers
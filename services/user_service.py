@@ -1,8 +1,16 @@
 """
 services/user_service.py — User registration and lookup helpers.
+
+Reachability: a user who blocked the bot (or whose chat is gone) gets
+User.unreachable_since set by the senders (mark_unreachable) and drops out
+of every notification query (reachable()). Any update from the user clears
+it again (mark_reachable, middlewares/reachability.py).
 """
 from __future__ import annotations
 
+from collections.abc import Collection
+
+from sqlalchemy import exists, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import NotificationSettings, User
@@ -49,3 +57,47 @@ async def get_or_create_user(
             await session.commit()
 
     return user
+
+
+def reachable(user_id_column):
+    """
+    Condition for notification queries: the user is not marked unreachable.
+    An anti-join against the small partial index ix_users_unreachable.
+    """
+    return ~exists().where(User.id == user_id_column, User.unreachable_since.isnot(None))
+
+
+async def mark_unreachable(session: AsyncSession, user_ids: Collection[int]) -> int:
+    """
+    Mark users the bot can no longer write to. Keeps the first timestamp for
+    users already marked. Does not commit; returns how many were newly marked.
+    """
+    if not user_ids:
+        return 0
+    result = await session.execute(
+        update(User)
+        .where(User.id.in_(user_ids), User.unreachable_since.is_(None))
+        .values(unreachable_since=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+async def marked_unreachable(session: AsyncSession, user_id: int) -> bool:
+    """Whether the user carries the unreachable mark. A primary key lookup, fine on a replica."""
+    marked = await session.scalar(select(User.unreachable_since).where(User.id == user_id))
+    return marked is not None
+
+
+async def mark_reachable(session: AsyncSession, user_id: int) -> bool:
+    """
+    Clear the unreachable mark after the user got in touch again. Writes
+    nothing for users who were never marked. Does not commit.
+    """
+    result = await session.execute(
+        update(User)
+        .where(User.id == user_id, User.unreachable_since.isnot(None))
+        .values(unreachable_since=None)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
@@ -39,6 +39,12 @@ export type CategoryApi = { id: number; user_id: number; name: string }
 
 export type ReportSummaryApi = { total_monthly: number; by_category: Record<string, number> }
 
+export type ForecastApi = {
+  months: { month: string; total: number; by_category: Record<string, number> | null }[]
+  total: number
+  by_day: Record<string, number> | null
+}
+
 export const subscriptions = {
   list: () => api<SubscriptionApi[]>('/subscriptions'),
   create: (body: { name: string; price: number; period: string; category_id?: number; next_payment: string }) =>
@@ -54,6 +60,12 @@ export const categories = {
 
 export const reports = {
   summary: () => api<ReportSummaryApi>('/reports/summary'),
+  forecast: (months = 12, opts: { groupBy?: 'category'; granularity?: 'month' | 'day' } = {}) => {
+    const params = new URLSearchParams({ months: String(months) })
+    if (opts.groupBy) params.set('group_by', opts.groupBy)
+    if (opts.granularity) params.set('granularity', opts.granularity)
+    return api<ForecastApi>(`/reports/forecast?${params}`)
+  },
 }
 
 export const auth = {
@@ -0,0 +1,54 @@
+"""
+Bench: next_occurrence / occurrences_between against the month-stepping loop.
+
+    python tests/bench_occurrences.py [cases]
+
+Origins are up to 20 years behind the target, the case the stepping loop
+is slowest at (a subscription that was not advanced for a long time).
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.occurrences import next_occurrence, occurrences_between  # noqa: E402
+from test_occurrences import PERIODS, _naive_between, _naive_next, _origin  # noqa: E402
+
+
+def _cases(count: int) -> list[tuple]:
+    rng = random.Random(1)
+    cases = []
+    for _ in range(count):
+        period = rng.choice(sorted(PERIODS))
+        anchor = rng.randint(1, 31)
+        origin = _origin(rng.randint(2000, 2020), rng.randint(1, 12), anchor)
+        first = date(2026, 1, 1) + timedelta(days=rng.randint(0, 365))
+        cases.append((origin, anchor, period, first, first + timedelta(days=365)))
+    return cases
+
+
+def _timed(label: str, fn, cases: list[tuple]) -> float:
+    started = time.perf_counter()
+    for case in cases:
+        fn(*case)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<36} {elapsed * 1e3:8.1f} ms  {elapsed / len(cases) * 1e6:6.2f} us/case")
+    return elapsed
+
+
+def main() -> None:
+    cases = _cases(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
+    print(f"{len(cases)} case(s)")
+    direct = _timed("next_occurrence", lambda o, a, p, f, _: next_occurrence(o, a, p, f), cases)
+    naive = _timed("next_occurrence, naive loop", lambda o, a, p, f, _: _naive_next(o, a, p, f), cases)
+    print(f"  x{naive / direct:.1f}")
+    direct = _timed("occurrences_between (1 year)", occurrences_between, cases)
+    naive = _timed("occurrences_between, naive loop", _naive_between, cases)
+    print(f"  x{naive / direct:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from services.forecast import FORECAST_MAX_MONTHS, compute_forecast, data_version
+from services.snapshot import NO_CATEGORY, SubscriptionSnapshot
+
+
+def _snapshot(*rows) -> SubscriptionSnapshot:
+    """Rows as (id, category_id, price, period, next_payment, anchor_day, is_active), all of user 1."""
+    snapshot = SubscriptionSnapshot.allocate(len(rows))
+    if rows:
+        snapshot.fill(0, [
+            (id_, 1, category_id, Decimal(price), period, next_payment, anchor, active)
+            for id_, category_id, price, period, next_payment, anchor, active in rows
+        ])
+    return snapshot
+
+
+def test_month_rollover_into_next_year():
+    snapshot = _snapshot((1, None, "10", "monthly", date(2026, 11, 30), 31, True))
+    forecast = compute_forecast(snapshot, date(2026, 11, 15), months=4, by_day=True)
+    assert forecast.months == ["2026-11", "2026-12", "2027-01", "2027-02"]
+    assert forecast.totals == [1000, 1000, 1000, 1000]
+    # The anchor 31 survives November and February
+    assert list(forecast.by_day) == ["2026-11-30", "2026-12-31", "2027-01-31", "2027-02-28"]
+
+
+def test_yearly_pays_once_in_its_month():
+    snapshot = _snapshot(
+        (1, None, "1200", "yearly", date(2027, 2, 10), 10, True),
+        (2, None, "5", "monthly", date(2026, 10, 20), 20, True),
+    )
+    forecast = compute_forecast(snapshot, date(2026, 10, 1), months=18)
+    assert forecast.totals[4] == 120000 + 500  # 2027-02
+    assert forecast.totals[16] == 120000 + 500  # 2028-02
+    assert sum(forecast.totals) == 2 * 120000 + 18 * 500
+
+
+def test_payments_before_start_and_inactive_left_out():
+    snapshot = _snapshot(
+        (1, None, "10", "monthly", date(2026, 10, 5), 5, True),  # not advanced yet: before start
+        (2, None, "99", "monthly", date(2026, 10, 20), 20, False),
+    )
+    forecast = compute_forecast(snapshot, date(2026, 10, 17), months=2)
+    assert forecast.totals == [0, 1000]
+
+
+def test_group_by_category():
+    snapshot = _snapshot(
+        (1, 7, "10", "monthly", date(2026, 10, 20), 20, True),
+        (2, 7, "2.50", "monthly", date(2026, 10, 25), 25, True),
+        (3, None, "120", "yearly", date(2026, 11, 1), 1, True),
+        (4, 8, "1", "monthly", date(2026, 10, 21), 21, False),
+    )
+    forecast = compute_forecast(snapshot, date(2026, 10, 17), months=3, by_category=True)
+    assert forecast.by_category == {7: [1250, 1250, 1250], NO_CATEGORY: [0, 12000, 0]}
+    assert forecast.totals == [1250, 13250, 1250]
+    assert forecast.total == 15750
+
+
+def test_empty_snapshot_and_bounds():
+    forecast = compute_forecast(_snapshot(), date(2026, 10, 17), months=2, by_category=True, by_day=True)
+    assert forecast.totals == [0, 0] and forecast.by_category == {} and forecast.by_day == {}
+    with pytest.raises(ValueError):
+        compute_forecast(_snapshot(), date(2026, 10, 17), months=FORECAST_MAX_MONTHS + 1)
+
+
+def test_data_version_follows_probe():
+    assert data_version((3, 1.5, 1, 2.0)) == data_version([3, 1.5, 1, 2.0])
+    assert data_version((3, 1.5, 1, 2.0)) != data_version((3, 1.5, 1, 2.5))
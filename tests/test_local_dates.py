@@ -0,0 +1,26 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from services.notification_service import local_dates
+
+# Zones at the edges of the range and in between
+ZONES = ["Etc/GMT+12", "Pacific/Honolulu", "America/New_York", "UTC", "Europe/Moscow", "Asia/Tokyo", "Pacific/Kiritimati"]
+
+
+@pytest.mark.parametrize("hour, minute", [(10, 30), (11, 45)])
+def test_middle_date_included_late_morning_utc(hour, minute):
+    # Between 10:00 and 11:59 UTC the dates in effect are D-1, D and D+1
+    now = datetime(2026, 10, 17, hour, minute, tzinfo=timezone.utc)
+    assert local_dates(now) == [date(2026, 10, 16), date(2026, 10, 17), date(2026, 10, 18)]
+
+
+def test_every_zone_date_covered_all_day():
+    start = datetime(2026, 10, 17, tzinfo=timezone.utc)
+    for step in range(24 * 4):
+        now = start + timedelta(minutes=15 * step)
+        dates = local_dates(now)
+        assert dates == sorted(set(dates))
+        for zone in ZONES:
+            assert now.astimezone(ZoneInfo(zone)).date() in dates, (now, zone)
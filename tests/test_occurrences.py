@@ -0,0 +1,102 @@
+"""
+services/occurrences.py against the obvious loop: walk the series one
+period at a time from origin, clamping the anchor day to each month.
+"""
+import calendar
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from services.occurrences import next_occurrence, occurrence, occurrences_between
+
+PERIODS = {"monthly": 1, "yearly": 12}
+
+
+def _naive_series(origin: date, anchor: int, period: str):
+    """Payment dates from origin on, stepping month by month."""
+    year, month = origin.year, origin.month
+    yield origin
+    while True:
+        for _ in range(PERIODS[period]):
+            month += 1
+            if month > 12:
+                year, month = year + 1, 1
+        yield date(year, month, min(anchor, calendar.monthrange(year, month)[1]))
+
+
+def _naive_between(origin: date, anchor: int, period: str, first: date, last: date) -> list[date]:
+    dates = []
+    for due in _naive_series(origin, anchor, period):
+        if due > last:
+            return dates
+        if due >= first:
+            dates.append(due)
+
+
+def _naive_next(origin: date, anchor: int, period: str, on_or_after: date) -> date:
+    return next(due for due in _naive_series(origin, anchor, period) if due >= on_or_after)
+
+
+def _origin(year: int, month: int, anchor: int) -> date:
+    """A payment date of the series: the anchor clamped to the month."""
+    return date(year, month, min(anchor, calendar.monthrange(year, month)[1]))
+
+
+@pytest.mark.parametrize("period", sorted(PERIODS))
+@pytest.mark.parametrize("anchor", [1, 15, 28, 29, 30, 31])
+def test_next_occurrence_matches_naive(anchor, period):
+    # Every origin month of 2023-2024 (leap Feb included), every target day of 2024-2026
+    targets = [date(2024, 1, 1) + timedelta(days=n) for n in range(0, 3 * 366, 3)]
+    for month_index in range(24):
+        origin = _origin(2023 + month_index // 12, month_index % 12 + 1, anchor)
+        for target in targets:
+            assert next_occurrence(origin, anchor, period, target) == _naive_next(origin, anchor, period, target), (
+                origin, anchor, period, target,
+            )
+
+
+@pytest.mark.parametrize("period", sorted(PERIODS))
+@pytest.mark.parametrize("anchor", [29, 30, 31])
+def test_occurrences_between_matches_naive(anchor, period):
+    for month_index in range(24):
+        origin = _origin(2023 + month_index // 12, month_index % 12 + 1, anchor)
+        for first, last in [
+            (date(2024, 1, 1), date(2024, 12, 31)),
+            (date(2024, 2, 28), date(2024, 3, 1)),
+            (date(2025, 2, 1), date(2025, 2, 28)),
+            (date(2022, 6, 1), date(2028, 6, 1)),
+            (date(2024, 5, 31), date(2024, 5, 31)),
+        ]:
+            assert occurrences_between(origin, anchor, period, first, last) == _naive_between(
+                origin, anchor, period, first, last
+            ), (origin, anchor, period, first, last)
+
+
+def test_random_series_match_naive():
+    rng = random.Random(20261017)
+    for _ in range(5000):
+        period = rng.choice(sorted(PERIODS))
+        anchor = rng.randint(1, 31)
+        origin = _origin(rng.randint(1990, 2030), rng.randint(1, 12), anchor)
+        first = origin + timedelta(days=rng.randint(-400, 4000))
+        last = first + timedelta(days=rng.randint(0, 800))
+        assert next_occurrence(origin, anchor, period, first) == _naive_next(origin, anchor, period, first)
+        assert occurrences_between(origin, anchor, period, first, last) == _naive_between(
+            origin, anchor, period, first, last
+        )
+
+
+def test_anchor_survives_short_months():
+    # Jan 31 -> Feb 29 (leap) -> Mar 31, not Mar 29
+    assert [occurrence(date(2024, 1, 31), 31, "monthly", n) for n in range(4)] == [
+        date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30),
+    ]
+    # Yearly Feb 29 -> Feb 28 in common years, Feb 29 again in the next leap year
+    assert occurrences_between(date(2024, 2, 29), 29, "yearly", date(2024, 1, 1), date(2028, 12, 31)) == [
+        date(2024, 2, 29), date(2025, 2, 28), date(2026, 2, 28), date(2027, 2, 28), date(2028, 2, 29),
+    ]
+
+
+def test_unknown_period_is_monthly():
+    assert next_occurrence(date(2024, 1, 31), 31, "weekly", date(2024, 2, 1)) == date(2024, 2, 29)
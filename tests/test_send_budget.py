@@ -0,0 +1,55 @@
+import asyncio
+
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+
+from services.send_budget import SendBudgetMiddleware, interactive_replies, mark_precharged
+
+
+class _CountingBucket:
+    def __init__(self) -> None:
+        self.taken = 0
+
+    async def acquire(self) -> None:
+        self.taken += 1
+
+
+async def _request(bot, method):
+    return "ok"
+
+
+def _taken(send) -> int:
+    """Tokens the middleware takes while `send(middleware)` runs in a task of its own."""
+    bucket = _CountingBucket()
+
+    async def main():
+        assert await asyncio.create_task(send(SendBudgetMiddleware(bucket))) == "ok"
+
+    asyncio.run(main())
+    return bucket.taken
+
+
+def test_background_sends_are_charged():
+    async def send(middleware):
+        return await middleware(_request, None, SendMessage(chat_id=1, text="x"))
+
+    assert _taken(send) == 1
+
+
+def test_replies_are_not_charged():
+    async def send(middleware):
+        with interactive_replies():
+            return await middleware(_request, None, SendMessage(chat_id=1, text="x"))
+
+    assert _taken(send) == 0
+
+
+def test_precharged_sends_and_other_methods_are_not_charged():
+    async def precharged(middleware):
+        mark_precharged()
+        return await middleware(_request, None, SendMessage(chat_id=1, text="x"))
+
+    async def answer(middleware):
+        return await middleware(_request, None, AnswerCallbackQuery(callback_query_id="1"))
+
+    assert _taken(precharged) == 0
+    assert _taken(answer) == 0
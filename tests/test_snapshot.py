@@ -0,0 +1,130 @@
+"""SubscriptionSnapshot's vectorized queries against plain Python over the same rows."""
+import asyncio
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from services.occurrences import occurrences_between
+from services.snapshot import NO_CATEGORY, PERIOD_CODES, SubscriptionSnapshot, load_snapshot
+
+
+def _random_snapshot(rng: random.Random, size: int, prices: list[int]) -> SubscriptionSnapshot:
+    """Rows ordered by (user_id, id), as load_snapshot returns them."""
+    snapshot = SubscriptionSnapshot.allocate(size)
+    users = sorted(rng.randint(1, max(1, size // 3)) for _ in range(size))
+    for i, user_id in enumerate(users):
+        anchor = rng.randint(1, 31)
+        year, month = rng.randint(2025, 2027), rng.randint(1, 12)
+        snapshot.id[i] = i + 1
+        snapshot.user_id[i] = user_id
+        snapshot.category_id[i] = rng.choice([NO_CATEGORY, 1, 2])
+        snapshot.price_minor[i] = rng.choice(prices)
+        snapshot.next_payment[i] = np.datetime64(date(year, month, min(anchor, 28)), "D")
+        snapshot.anchor_day[i] = anchor
+        snapshot.period[i] = rng.choice(list(PERIOD_CODES.values()))
+        snapshot.is_active[i] = rng.random() < 0.8
+    return snapshot
+
+
+def _rows(snapshot: SubscriptionSnapshot) -> list[dict]:
+    return [
+        {name: getattr(snapshot, name)[i].item() for name in ("id", "user_id", "price_minor", "is_active")}
+        for i in range(len(snapshot))
+    ]
+
+
+def _top_reference(snapshot: SubscriptionSnapshot, n: int, mask) -> list[int]:
+    by_user: dict[int, list[int]] = {}
+    for i, row in enumerate(_rows(snapshot)):
+        if mask is None or mask[i]:
+            by_user.setdefault(row["user_id"], []).append(i)
+    top = []
+    for user_id in sorted(by_user):
+        indices = sorted(by_user[user_id], key=lambda i: (-int(snapshot.price_minor[i]), int(snapshot.id[i])))
+        top += indices[:n]
+    return top
+
+
+@pytest.mark.parametrize(
+    "prices",
+    [
+        [0, 100, 100, 250],  # ties and zero
+        [-500, -1, 0, 0, 7],  # negative prices
+        [-(2 ** 62), 0, 2 ** 62],  # span too wide to pack: the lexsort fallback
+    ],
+)
+def test_top_by_price_matches_reference(prices):
+    rng = random.Random(len(prices))
+    for size in (0, 1, 2, 50, 400):
+        snapshot = _random_snapshot(rng, size, prices)
+        for n in (1, 3):
+            for mask in (None, snapshot.is_active):
+                assert snapshot.top_by_price(n, mask).tolist() == _top_reference(snapshot, n, mask)
+
+
+def test_per_user_matches_reference():
+    rng = random.Random(2)
+    snapshot = _random_snapshot(rng, 300, [-100, 0, 1, 999, 120000])
+    users, totals = snapshot.per_user(snapshot.price_minor, snapshot.is_active)
+    expected: dict[int, int] = {}
+    for row in _rows(snapshot):
+        expected[row["user_id"]] = expected.get(row["user_id"], 0) + (row["price_minor"] if row["is_active"] else 0)
+    assert dict(zip(users.tolist(), totals.tolist())) == expected
+    assert users.tolist() == sorted(expected)
+
+    empty_users, empty_totals = SubscriptionSnapshot.allocate(0).per_user(np.zeros(0, dtype=np.int64))
+    assert len(empty_users) == len(empty_totals) == 0
+
+
+def test_month_grid_matches_occurrences():
+    rng = random.Random(3)
+    snapshot = _random_snapshot(rng, 300, [100])
+    periods = {code: name for name, code in PERIOD_CODES.items()}
+    hit, days = snapshot.month_grid(2026, 11, 26)
+    first, last = date(2026, 11, 1), date(2028, 12, 31)
+    for i in range(len(snapshot)):
+        origin = snapshot.next_payment[i].astype(date)
+        expected = occurrences_between(
+            origin, int(snapshot.anchor_day[i]), periods[int(snapshot.period[i])], first, last,
+        )
+        got = [days[i, m].astype(date) for m in range(hit.shape[1]) if hit[i, m]]
+        assert got == expected, (i, origin)
+
+
+def test_load_snapshot_streams_in_chunks(tmp_path):
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from database.models import Base, Subscription, User
+
+    async def check():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'snapshot.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine)
+        async with factory() as session:
+            session.add_all([User(id=2), User(id=1)])
+            await session.flush()
+            session.add_all([
+                Subscription(
+                    user_id=2 - n % 2, name=str(n), price=Decimal(n) / 4, period=["monthly", "yearly"][n % 2],
+                    next_payment=date(2026, 10, 1) + timedelta(days=n), category_id=None,
+                )
+                for n in range(7)
+            ])
+            await session.commit()
+        async with factory() as session:
+            snapshot = await load_snapshot(session, chunk_size=3)
+            own = await load_snapshot(session, user_ids=[2], chunk_size=2)
+        await engine.dispose()
+        return snapshot, own
+
+    snapshot, own = asyncio.run(check())
+    assert snapshot.user_id.tolist() == [1, 1, 1, 2, 2, 2, 2]
+    assert snapshot.id.tolist() == [2, 4, 6, 1, 3, 5, 7]
+    assert snapshot.price_minor.tolist() == [25, 75, 125, 0, 50, 100, 150]
+    assert snapshot.category_id.tolist() == [NO_CATEGORY] * 7
+    assert own.id.tolist() == [1, 3, 5, 7]
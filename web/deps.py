@@ -1,5 +1,5 @@
 from collections.abc import AsyncGenerator
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 import jwt
@@ -18,9 +18,39 @@ def _jwt_secret() -> str:
     return config.BOT_TOKEN.get_secret_value()
 
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with db_helper.session_factory() as session:
+def read_only(request: Request) -> None:
+    """
+    Маркер для маршрутов, которые только читают из БД:
+    @router.get(..., dependencies=[Depends(read_only)]).
+    Зависимости маршрута разрешаются раньше параметров, поэтому get_db
+    (и get_current_user вместе с ним) получает сессию только для чтения.
+    """
+    request.state.db_read_only = True
+
+
+def _token_user_id(credentials: HTTPAuthorizationCredentials | None) -> int | None:
+    """user_id из JWT без проверок доступа — только для выбора шарда и узла БД."""
+    if not credentials or not credentials.credentials:
+        return None
+    try:
+        payload = jwt.decode(credentials.credentials, _jwt_secret(), algorithms=["HS256"])
+        return int(payload["sub"])
+    except (jwt.InvalidTokenError, KeyError, ValueError):
+        return None
+
+
+async def get_db(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials | None = Depends(security),
+) -> AsyncGenerator[AsyncSession, None]:
+    user_id = _token_user_id(credentials)
+    if getattr(request.state, "db_read_only", False):
+        async with db_helper.reader(user_id)() as session:
+            yield session
+        return
+    async with db_helper.writer(user_id)() as session:
         yield session
+        db_helper.note_session_end(session, user_id)
 
 
 async def get_current_user(
@@ -2,15 +2,28 @@
 REST API для сайта subboy. Та же БД и модели, что и у бота.
 Запуск: uvicorn web.main:app --host 0.0.0.0 --port 8000
 """
-from fastapi import FastAPI
+import secrets
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
 from config import config
+from database.db_helper import db_helper
 from web.routes import auth, categories, subscriptions, reports, bot_info
 
-app = FastAPI(title="Subboy API", version="1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Прогреваем пул соединений, чтобы первые запросы не ждали подключения к БД
+    await db_helper.warmup(config.DB_POOL_WARMUP)
+    yield
+    await db_helper.dispose()
+
+
+app = FastAPI(title="Subboy API", version="1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,6 +46,16 @@ app.include_router(reports.router, prefix="/api")
 app.include_router(bot_info.router, prefix="/api")
 
 
+# Регистрируем до монтирования статики: mount("/") перехватывает все пути, объявленные после него
+# Публично — только статус; статистика пулов и реплик — по токену HEALTH_TOKEN
+@app.get("/api/health")
+def health(authorization: str | None = Header(default=None)):
+    token = config.HEALTH_TOKEN
+    if token and authorization and secrets.compare_digest(authorization, f"Bearer {token}"):
+        return {"status": "ok", "db_shards": db_helper.stats()}
+    return {"status": "ok"}
+
+
 # Раздаём статику subboy: приоритет — собранное React-приложение (subboy/dist)
 subboy_path = Path(__file__).resolve().parent.parent / "subboy"
 subboy_dist = subboy_path / "dist"
@@ -40,8 +63,3 @@ if (subboy_dist / "index.html").exists():
     app.mount("/", StaticFiles(directory=str(subboy_dist), html=True), name="subboy")
 elif (subboy_path / "index.html").exists():
     app.mount("/", StaticFiles(directory=str(subboy_path), html=True), name="subboy")
-
-
-@app.get("/api/health")
-def health():
-    return {"status": "ok"}
@@ -42,7 +42,7 @@ async def login_telegram(body: TelegramLoginBody):
     )
     if not ok:
         raise HTTPException(status_code=400, detail="Неверные данные от Telegram")
-    async with db_helper.session_factory() as session:
+    async with db_helper.writer(body.id)() as session:
         full_name = (body.first_name or "") + (" " + (body.last_name or "")).strip()
         user = await get_or_create_user(
             session, body.id, username=body.username, full_name=full_name or None
@@ -68,7 +68,7 @@ async def dev_login(body: DevLoginBody, request: Request):
     host = (request.client.host if request.client else "") or request.headers.get("host", "")
     if "localhost" not in host and "127.0.0.1" not in host:
         raise HTTPException(status_code=403, detail="Доступно только с localhost")
-    async with db_helper.session_factory() as session:
+    async with db_helper.writer(body.user_id)() as session:
         user = await get_or_create_user(session, body.user_id)
     payload = {"sub": str(user.id), "exp": datetime.utcnow() + timedelta(days=30)}
     token = jwt.encode(payload, _jwt_secret(), algorithm="HS256")
@@ -3,13 +3,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database.models import Category, User
 from database.db_helper import db_helper
-from web.deps import get_db, get_current_user
+from web.deps import get_db, get_current_user, read_only
 from web.schemas import CategoryCreate, CategoryOut
 
 router = APIRouter(prefix="/categories", tags=["categories"])
 
 
-@router.get("", response_model=list[CategoryOut])
+@router.get("", response_model=list[CategoryOut], dependencies=[Depends(read_only)])
 async def list_categories(
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_db),
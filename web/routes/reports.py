@@ -1,17 +1,26 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import extract, func, select
 from sqlalchemy.orm import joinedload
-from database.models import Subscription, User
+from database.models import Category, Subscription, User
 from database.db_helper import db_helper
-from web.deps import get_db, get_current_user
-from web.schemas import ReportSummary
+from services.forecast import FORECAST_MAX_MONTHS, ForecastCache, compute_forecast, data_version
+from services.snapshot import MINOR_UNITS, NO_CATEGORY, load_snapshot
+from web.deps import get_db, get_current_user, read_only
+from web.schemas import ForecastMonth, ForecastOut, ReportSummary
+from datetime import date
 from decimal import Decimal
+from typing import Literal, Optional
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
+NO_CATEGORY_NAME = "Без категории"
 
-@router.get("/summary", response_model=ReportSummary)
+# Готовые прогнозы по (пользователь, версия данных, параметры) — общий на процесс
+_forecast_cache = ForecastCache()
+
+
+@router.get("/summary", response_model=ReportSummary, dependencies=[Depends(read_only)])
 async def report_summary(
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_db),
@@ -28,9 +37,89 @@ async def report_summary(
     for sub in subscriptions:
         monthly = sub.price if sub.period == "monthly" else sub.price / 12
         total += monthly
-        cat_name = sub.category.name if sub.category else "Без категории"
+        cat_name = sub.category.name if sub.category else NO_CATEGORY_NAME
         by_category[cat_name] = by_category.get(cat_name, 0) + float(monthly)
     return ReportSummary(
         total_monthly=float(total),
         by_category=by_category,
     )
+
+
+@router.get("/forecast", response_model=ForecastOut, dependencies=[Depends(read_only)])
+async def report_forecast(
+    request: Request,
+    response: Response,
+    months: int = Query(12, ge=1, le=FORECAST_MAX_MONTHS),
+    group_by: Optional[Literal["category"]] = None,
+    granularity: Literal["month", "day"] = "month",
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+):
+    """
+    Прогноз списаний по месяцам начиная с текущего (и по дням при granularity=day).
+    Считается одним проходом по подпискам пользователя; результат кэшируется
+    по версии данных, она же — ETag. Версия берётся из лёгкого запроса
+    (_forecast_probe), так что 304 и ответ из кэша обходятся без загрузки подписок.
+    """
+    probe = await session.execute(_forecast_probe(user.id))
+    today = date.today()
+    version = data_version(probe.one())
+    key = (user.id, version, today, months, group_by, granularity)
+    etag = f'"{version}-{today.isoformat()}-{months}-{group_by or "all"}-{granularity}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    cached = _forecast_cache.get(key)
+    if cached is not None:
+        return cached
+
+    snapshot = await load_snapshot(session, user_ids=[user.id])
+    rows = await session.execute(select(Category.id, Category.name).where(Category.user_id == user.id))
+    category_names = {category_id: name for category_id, name in rows.all()}
+
+    forecast = compute_forecast(
+        snapshot, today, months, by_category=group_by == "category", by_day=granularity == "day",
+    )
+    by_category = [
+        (category_names.get(category_id, NO_CATEGORY_NAME) if category_id != NO_CATEGORY else NO_CATEGORY_NAME, amounts)
+        for category_id, amounts in forecast.by_category.items()
+    ]
+    result = ForecastOut(
+        months=[
+            ForecastMonth(
+                month=month,
+                total=forecast.totals[i] / MINOR_UNITS,
+                by_category=_sum_by_name(by_category, i) if group_by == "category" else None,
+            )
+            for i, month in enumerate(forecast.months)
+        ],
+        total=forecast.total / MINOR_UNITS,
+        by_day={day: amount / MINOR_UNITS for day, amount in forecast.by_day.items()} if granularity == "day" else None,
+    )
+    _forecast_cache.put(key, result)
+    return result
+
+
+def _forecast_probe(user_id: int):
+    # Число строк и сумма updated_at подписок и категорий: любое изменение (правка, удаление,
+    # сдвиг дат планировщиком) меняет хотя бы одно из них, в отличие от max(updated_at)
+    # при долгой транзакции, закоммиченной позже более свежей
+    def stats(model):
+        rows = select(model.updated_at).where(model.user_id == user_id).subquery()
+        return (
+            select(func.count()).select_from(rows).scalar_subquery(),
+            select(func.sum(extract("epoch", rows.c.updated_at))).scalar_subquery(),
+        )
+
+    return select(*stats(Subscription), *stats(Category))
+
+
+def _sum_by_name(by_category: list[tuple[str, list[int]]], month: int) -> dict[str, float]:
+    # Категории с одинаковыми названиями складываются, как в /summary
+    totals: dict[str, float] = {}
+    for name, amounts in by_category:
+        if amounts[month]:
+            totals[name] = totals.get(name, 0) + amounts[month] / MINOR_UNITS
+    return totals
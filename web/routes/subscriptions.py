@@ -4,14 +4,16 @@ from sqlalchemy import select
 from sqlalchemy.orm import joinedload
 from database.models import Subscription, User
 from database.db_helper import db_helper
-from web.deps import get_db, get_current_user
+from services.lead_days import lead_days_mask
+from services.reminders import notify_reminders_changed
+from web.deps import get_db, get_current_user, read_only
 from web.schemas import SubscriptionCreate, SubscriptionOut
 from decimal import Decimal
 
 router = APIRouter(prefix="/subscriptions", tags=["subscriptions"])
 
 
-@router.get("", response_model=list[SubscriptionOut])
+@router.get("", response_model=list[SubscriptionOut], dependencies=[Depends(read_only)])
 async def list_subscriptions(
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_db),
@@ -38,8 +40,11 @@ async def create_subscription(
         period=body.period,
         category_id=body.category_id,
         next_payment=body.next_payment,
+        anchor_day=body.anchor_day or body.next_payment.day,
+        lead_days=lead_days_mask(body.lead_days) if body.lead_days is not None else None,
     )
     session.add(sub)
+    await notify_reminders_changed(session, user.id)
     await session.commit()
     await session.refresh(sub)
     return sub
@@ -60,5 +65,6 @@ async def delete_subscription(
     if not sub:
         raise HTTPException(status_code=404, detail="Подписка не найдена")
     await session.delete(sub)
+    await notify_reminders_changed(session, user.id)
     await session.commit()
     return {"ok": True}
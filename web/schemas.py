@@ -1,8 +1,10 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from datetime import date, datetime
 from decimal import Decimal
 from typing import Optional
 
+from services.lead_days import lead_days_list
+
 
 class CategoryCreate(BaseModel):
     name: str
@@ -23,6 +25,17 @@ class SubscriptionCreate(BaseModel):
     period: str  # monthly | yearly
     category_id: Optional[int] = None
     next_payment: date
+    # День месяца для следующих списаний (31 — последний день короткого месяца); не задан — день next_payment
+    anchor_day: Optional[int] = None
+    # За сколько дней напоминать, напр. [1, 7]; не задано — как в настройках, [] — не напоминать
+    lead_days: Optional[list[int]] = None
+
+    @field_validator("anchor_day")
+    @classmethod
+    def _anchor_day_in_month(cls, value):
+        if value is not None and not 1 <= value <= 31:
+            raise ValueError("anchor_day must be between 1 and 31")
+        return value
 
 
 class SubscriptionOut(BaseModel):
@@ -33,7 +46,14 @@ class SubscriptionOut(BaseModel):
     price: Decimal
     period: str
     next_payment: date
+    anchor_day: Optional[int] = None
     created_at: datetime
+    lead_days: Optional[list[int]] = None
+
+    @field_validator("lead_days", mode="before")
+    @classmethod
+    def _lead_days_from_mask(cls, value):
+        return lead_days_list(value) if isinstance(value, int) else value
 
     class Config:
         from_attributes = True
@@ -42,3 +62,17 @@ class SubscriptionOut(BaseModel):
 class ReportSummary(BaseModel):
     total_monthly: float
     by_category: dict[str, float]
+
+
+class ForecastMonth(BaseModel):
+    month: str  # 'YYYY-MM'
+    total: float
+    # Название категории -> сумма; только при group_by=category
+    by_category: Optional[dict[str, float]] = None
+
+
+class ForecastOut(BaseModel):
+    months: list[ForecastMonth]
+    total: float
+    # 'YYYY-MM-DD' -> сумма списаний в этот день; только при granularity=day
+    by_day: Optional[dict[str, float]] = None
@@ -0,0 +1,91 @@
+"""
+worker.py — Standalone notification worker.
+
+Runs the background side of the bot (services/background.py): the
+APScheduler jobs and the exact-time reminder engine on the elected leader,
+and the notification outbox workers. It does not poll Telegram and does not
+import the handler routers, so a long notification run never competes with
+interactive updates for the event loop or the DB pool.
+
+Deploy next to bot replicas started with BOT_BACKGROUND_JOBS=false and
+scale each side on its own: any number of workers can run, leader election
+keeps the jobs on one of them and all of them drain the outbox.
+
+Startup sequence:
+1. Load config (pydantic settings)
+2. Create Bot (sending only) with the shared send budget
+3. Start the background jobs
+4. Run until SIGINT / SIGTERM, then stop them gracefully
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+import sys
+
+# Fix for Windows event loop
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+
+from config import config
+from database.db_helper import db_helper
+from services.background import Background, create_send_bucket
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Logging
+# ──────────────────────────────────────────────────────────────────────────────
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Main
+# ──────────────────────────────────────────────────────────────────────────────
+
+async def main() -> None:
+    bot = Bot(
+        token=config.BOT_TOKEN.get_secret_value(),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    send_bucket = create_send_bucket(bot, db_helper.session_factory, config.SEND_BUDGET_STORE, config.TELEGRAM_SEND_RATE)
+    await db_helper.warmup(config.DB_POOL_WARMUP)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C still arrives as KeyboardInterrupt
+            pass
+
+    background = Background.from_config(bot, db_helper.shards, send_bucket, config)
+    await background.start()
+    try:
+        logger.info("Notification worker started.")
+        await stop.wait()
+    finally:
+        await background.stop()
+        await bot.session.close()
+        logger.info("DB pool on shutdown: %s", db_helper.pool_stats())
+        await db_helper.dispose()
+        logger.info("Worker shut down cleanly.")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Worker stopped by user")
+    except Exception as e:
+        logger.exception("Worker crashed: %s", e)
+        sys.exit(1)